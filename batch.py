@@ -0,0 +1,198 @@
+import argparse
+import concurrent.futures
+import os
+import re
+import time
+import traceback
+
+import utils.utils
+import utils.cache
+import utils.video
+import utils.proxy
+import utils.plan
+import utils.workspace
+import utils.scheduler
+import utils.instrument
+import video_editor
+
+# Videos named by their course code (i.e. "S4V6 Close Loop Control.mp4")
+CODE_PATTERN = re.compile(r"^S\dV\d")
+
+
+def folder_codes(folder):
+    """Course codes (SXVX) of the videos of a folder"""
+    codes = set()
+    for filename in os.listdir(folder):
+        match = CODE_PATTERN.match(filename)
+        if match and os.path.isfile(os.path.join(folder, filename)):
+            codes.add(match.group())
+    return sorted(codes)
+
+
+def resolve_code(code):
+    """Paths of the recording, log and edited video of a course code"""
+    args = argparse.Namespace(video_file=code, output_file=code, move=False)
+    abs_paths = utils.utils.process_arguments(args, display=False)
+
+    # Edited video not created yet: same name as the recording
+    if not os.path.splitext(abs_paths["edited"])[1]:
+        name = os.path.basename(abs_paths["raw"]).replace(" (Raw)", "")
+        abs_paths["edited"] = os.path.join(os.path.dirname(abs_paths["edited"]), name)
+    return abs_paths
+
+
+def edit_video(code, abs_paths, queue, n_workers, param):
+    """Edits one video of the batch, its serial stages (event detection, split and
+    concat) run in this thread while its events go to the queue shared by every video
+    (see utils.scheduler.SharedQueue). Each video has its own workspace with its share
+    of the budget
+
+    Returns:
+        list: cache stats of the video (empty if there is no cache)
+    """
+    budget_gb = param["WORKSPACE_BUDGET_GB"]
+    with utils.workspace.Workspace(
+        param["WORKSPACE_FOLDER"],
+        prefix=f"video_editing_{code}_",
+        budget_bytes=budget_gb and budget_gb * 1e9 / param["BATCH_VIDEOS"],
+        tmpfs=param["WORKSPACE_TMPFS"],
+    ) as workspace:
+        return _edit_video(code, abs_paths, workspace, queue, n_workers, param)
+
+
+def _edit_video(code, abs_paths, workspace, queue, n_workers, param):
+    temp_folder = workspace.folder
+    event_times, index, proxy = video_editor.detect_events(
+        abs_paths, temp_folder, param
+    )
+    print(f"INFO: {code} - {len(event_times)} events")
+
+    if param["SINGLE_ENCODE"]:
+        with utils.instrument.stage("single_encode", video=code):
+            video_editor.render_single_encode(
+                event_times,
+                abs_paths["raw"],
+                abs_paths["edited"],
+                index["fps"],
+                param,
+                proxy,
+                utils.proxy.scale(index["height"], param),
+                index,
+            )
+        return []
+
+    cache = None
+    if param["CACHE"]:
+        cache = utils.cache.RenderCache(
+            param["CACHE_FOLDER"], param["CACHE_MAX_GB"] * 1e9
+        )
+    plan = video_editor.plan_render(
+        event_times, abs_paths["raw"], index, param, n_workers
+    )
+    utils.plan.save_plan(plan, utils.plan.plan_path(abs_paths["raw"]))
+    event_times = utils.plan.plan_events(plan)
+    video_editor.track_intermediates(workspace, plan, index, abs_paths["raw"])
+    segment_keys = video_editor.split_events(
+        abs_paths["raw"], plan, temp_folder, param, cache
+    )
+
+    arguments = video_editor.event_arguments(
+        plan, index, temp_folder, param, segment_keys
+    )
+    results = utils.scheduler.run_events(
+        video_editor.process_event,
+        arguments,
+        [item["cost"] for item in plan["events"]],
+        n_workers,
+        on_done=lambda k: workspace.consumed(("event", k)),
+        queue=queue,
+    )
+
+    video_list = [
+        os.path.join(temp_folder, f"output{i}.mp4") for i in range(len(event_times))
+    ]
+    with utils.instrument.stage("concat", video=code):
+        utils.video.concatenate_videos(video_list, abs_paths["edited"])
+    workspace.consumed("concat")
+    print(f"INFO: {code} - saved in {abs_paths['edited']}")
+
+    if cache is None:
+        return []
+    return [cache.stats()] + results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Edits several videos sharing a single pool of workers"
+    )
+    parser.add_argument("codes", nargs="*", help="Videos to be edited (SXVX format)")
+    parser.add_argument("--folder", help="Edit every SXVX video of this folder")
+    parser.add_argument(
+        "--profile",
+        default=video_editor.param["RENDER_PROFILE"],
+        choices=list(video_editor.param["RENDER_PROFILES"]),
+        help="Render profile (preview: fast low resolution review pass)",
+    )
+    args = parser.parse_args()
+
+    start = time.time()
+    param = dict(video_editor.param, RENDER_PROFILE=args.profile)
+    param["TRACE_FILE"] = utils.instrument.run_trace_file(param["TRACE_FILE"])
+    utils.instrument.configure(param["TRACE_FILE"], param["PROFILE_STAGES"])
+
+    codes = list(args.codes)
+    if args.folder:
+        codes += [code for code in folder_codes(args.folder) if code not in codes]
+    if not codes:
+        raise Exception("No videos to be edited")
+    abs_paths = {code: resolve_code(code) for code in codes}
+
+    n_workers = utils.scheduler.max_workers(param)
+    print(f"INFO: Editing {len(codes)} videos with {n_workers} workers")
+
+    # One process pool for the events of every video, fed longest event first across
+    # the videos. The serial stages of each video run in their own thread and overlap
+    # with the encodes of the others
+    errors = []
+    stats = []
+    with concurrent.futures.ProcessPoolExecutor(
+        n_workers, initializer=video_editor.warm_worker
+    ) as executor:
+        queue = utils.scheduler.SharedQueue(executor, n_workers)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(param["BATCH_VIDEOS"]) as videos:
+                futures = {
+                    videos.submit(
+                        edit_video,
+                        code,
+                        abs_paths[code],
+                        queue,
+                        n_workers,
+                        param,
+                    ): code
+                    for code in codes
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        stats += future.result()
+                    except Exception as e:
+                        print(f"ERROR: Video {futures[future]} failed")
+                        traceback.print_exception(type(e), e, e.__traceback__)
+                        errors.append(futures[future])
+        finally:
+            queue.close()
+
+    if param["CACHE"] and stats:
+        cache = utils.cache.RenderCache(
+            param["CACHE_FOLDER"], param["CACHE_MAX_GB"] * 1e9
+        )
+        utils.cache.print_report(stats, cache.evict())
+
+    if param["TRACE_FILE"]:
+        utils.instrument.merge_trace(param["TRACE_FILE"])
+
+    if errors:
+        raise Exception(f"Failed videos: {sorted(errors)}")
+
+    enlapsed_time = time.time() - start
+    print(f"DONE in {enlapsed_time:.1f} seconds ({enlapsed_time / 60:.1f} min)")
@@ -0,0 +1,323 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import moviepy.editor as mpye
+from pydub import AudioSegment
+
+import utils.utils
+import utils.audio
+import utils.video
+import utils.ffmpeg
+import utils.timeline
+import utils.probe
+import video_editor
+
+# Synthetic lecture: silent drawing sections followed by talking sections,
+# every third cycle is a "both" (raw) section
+DRAW_SECONDS = 8
+TALK_SECONDS = 12
+
+
+def seconds2log(seconds):
+    return str(datetime.timedelta(seconds=int(seconds)))
+
+
+def generate_recording(folder, minutes, debug=False):
+    """Generates a synthetic recording (testsrc video with a tone/silence audio
+    pattern) and its OBS style log file
+
+    Args:
+        folder (string): folder where the files are created
+        minutes (float): duration of the recording
+
+    Returns:
+        tuple of strings: (video path, log path)
+    """
+    video_path = os.path.join(folder, f"recording_{minutes}min.mp4")
+    log_path = os.path.join(folder, f"log_{minutes}min.txt")
+    duration = minutes * 60
+    period = DRAW_SECONDS + TALK_SECONDS
+
+    command = [
+        "ffmpeg",
+        "-y",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc=size=1920x1080:rate=30:duration={duration}",
+        "-f",
+        "lavfi",
+        "-i",
+        f"aevalsrc=0.3*sin(2*PI*440*t)*gte(mod(t\\,{period})\\,{DRAW_SECONDS})"
+        f":s=44100:c=stereo:d={duration}",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "veryfast",
+        "-profile:v",
+        "high",  # bitstream format of OBS x264 recordings (smart cut copies it)
+        "-pix_fmt",
+        "yuv420p",
+        "-g",
+        "60",
+        "-bf",
+        "2",  # B-frames like the OBS x264 presets
+        "-c:a",
+        "aac",
+        "-shortest",
+        f"{video_path}",
+    ]
+    utils.ffmpeg.run(command, debug)
+
+    with open(log_path, "w") as file:
+        for k, t in enumerate(range(0, int(duration), period)):
+            if k % 3 == 2:
+                file.write(f"{seconds2log(t)},Event Both\n")
+                continue
+            file.write(f"{seconds2log(t)},Event Draw\n")
+            if t + DRAW_SECONDS < duration:
+                file.write(f"{seconds2log(t + DRAW_SECONDS)},Event Talk\n")
+        file.write(f"{seconds2log(duration)},Event Stop\n")
+
+    return video_path, log_path
+
+
+def timed(results, name, function, *args, **kwargs):
+    start = time.perf_counter()
+    output = function(*args, **kwargs)
+    results[name] = time.perf_counter() - start
+    print(f"{name:40}: {results[name]:8.2f} s")
+    return output
+
+
+def benchmark_recording(video_path, log_path, temp_folder, skip_pydub=False):
+    """Times each stage of the pipeline for one recording
+
+    Returns:
+        dict: seconds taken by each stage
+    """
+    results = {}
+    # No cache hits or tracing overhead in the timings
+    param = dict(video_editor.param, CACHE=False, TRACE_FILE=None)
+    index = timed(results, "probe_media", utils.probe.probe_media, video_path)
+    duration = index["duration"]
+    fps = index["fps"]
+
+    # Events
+    event_times = timed(results, "log2times", utils.utils.log2times, log_path, duration)
+    event_times = timed(
+        results, "snap_events", utils.timeline.snap_events, event_times, fps
+    )
+
+    # Silence detection
+    if not skip_pydub:
+        video_audio = AudioSegment.from_file(video_path)
+        timed(
+            results,
+            "detect_silence",
+            utils.audio.detect_silence,
+            video_audio,
+            param["MIN_SILENCE_MS"],
+            param["SILENCE_THRESHOLD_dB"],
+        )
+        timed(
+            results,
+            "detect_silence_numpy",
+            utils.audio.detect_silence_numpy,
+            video_audio,
+            param["MIN_SILENCE_MS"],
+            param["SILENCE_THRESHOLD_dB"],
+        )
+    timed(
+        results,
+        "detect_silence_stream",
+        utils.audio.detect_silence_stream,
+        video_path,
+        param["MIN_SILENCE_MS"],
+        param["SILENCE_THRESHOLD_dB"],
+        param["SILENCE_SAMPLE_RATE"],
+    )
+
+    # Split
+    segments = [event.segment_times() for event in event_times]
+    destinations = [
+        os.path.join(temp_folder, f"video_segment_{i}.mp4")
+        for i in range(len(segments))
+    ]
+
+    start = time.perf_counter()
+    for (t_beg, t_end), destination in zip(segments, destinations):
+        utils.video.extract_video(video_path, destination, t_beg, t_end)
+    results["extract_video"] = time.perf_counter() - start
+    print(f"{'extract_video':40}: {results['extract_video']:8.2f} s")
+
+    keyframes = timed(
+        results, "keyframe_times", utils.ffmpeg.keyframe_times, video_path
+    )
+    starts = utils.video.keyframe_starts(keyframes, segments)
+    event_times = [
+        event.with_offset(t_beg - start)
+        for event, start, (t_beg, _) in zip(event_times, starts, segments)
+    ]
+    timed(
+        results,
+        "extract_videos",
+        utils.video.extract_videos,
+        video_path,
+        starts,
+        [t_end for _, t_end in segments],
+        destinations,
+        fps,
+        param["SPLIT_WORKERS"],
+    )
+
+    # Decoding of a sped up draw section, all frames vs the ones the speedup keeps
+    i = next(k for k, event in enumerate(event_times) if event["mode"] == "edit")
+    media = utils.probe.probe_media(destinations[i])
+    for speedup in [4, 60]:  # skips non reference frames / every frame but keyframes
+        chain = utils.ffmpeg.video_filter([0, DRAW_SECONDS], fps, speedup=speedup)
+        options = utils.ffmpeg.decimation_options(speedup, fps, media=media)
+        for name, input_options in [("all", []), ("skip", options)]:
+            frames = utils.ffmpeg.read_frames(
+                destinations[i],
+                chain,
+                media["width"],
+                media["height"],
+                event_times[i]["offset"],
+                input_options,
+            )
+            timed(results, f"decode_{speedup}x_{name}", sum, (1 for _ in frames))
+
+    # Process one event of each mode (second event onwards, to include the crossfade)
+    outputs = []
+    for mode in ["edit", "raw"]:
+        i = next(
+            k for k, event in enumerate(event_times) if k > 0 and event["mode"] == mode
+        )
+        backends = ["moviepy", "ffmpeg"] + (["smart_cut"] if mode == "raw" else [])
+        for backend in backends:
+            event_param = dict(
+                param,
+                RENDER_BACKEND="ffmpeg" if backend == "smart_cut" else backend,
+                SMART_CUT=backend == "smart_cut",
+            )
+            if backend == "smart_cut":
+                # Otherwise process_event falls back to the full encode
+                media = utils.probe.probe_media(destinations[i])
+                offset = event_times[i]["offset"]
+                trim = [offset, offset + event_times[i].n_frames("both") / fps]
+                assert video_editor.smart_cut_allowed(
+                    media, video_editor.render_profile(event_param), event_param
+                ), f"The recording cannot be smart cut: {media}"
+                assert utils.ffmpeg.smart_cut_points(
+                    media["keyframes"], trim, param["CROSSFADEIN_DURATION"]
+                ), f"No whole GOP in the raw event {i}"
+            timed(
+                results,
+                f"process_event_{mode}_{backend}",
+                video_editor.process_event,
+                i,
+                len(event_times),
+                event_times[i],
+                temp_folder,
+                event_param,
+                event_times[i - 1],
+            )
+        outputs.append(os.path.join(temp_folder, f"output{i}.mp4"))
+
+    # Colour palette (first edit event draw section)
+    i = next(k for k, event in enumerate(event_times) if event["mode"] == "edit")
+    draw = [event_times[i]["offset"], event_times[i]["offset"] + DRAW_SECONDS]
+    video = mpye.VideoFileClip(destinations[i]).subclip(draw[0], draw[1])
+    timed(
+        results,
+        "remove_colur_palette",
+        utils.video.remove_colur_palette,
+        video,
+        param["REMOVE_COLOUR_PALETTE_INTERVAL"],
+    )
+    video.close()
+    timed(
+        results,
+        "colour_palette_intervals_stream",
+        utils.video.colour_palette_intervals_stream,
+        destinations[i],
+        draw[0],
+        draw[1],
+        param["REMOVE_COLOUR_PALETTE_INTERVAL"],
+    )
+
+    # Join
+    timed(
+        results,
+        "concatenate_videos",
+        utils.video.concatenate_videos,
+        outputs,
+        os.path.join(temp_folder, "final_video.mp4"),
+    )
+
+    return results
+
+
+def code_version():
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        return output.stdout.strip() or None
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of each pipeline stage")
+    parser.add_argument(
+        "--minutes",
+        type=float,
+        nargs="+",
+        default=[1, 5],
+        help="Recording lengths to be benchmarked (minutes)",
+    )
+    parser.add_argument("--output", default="benchmark.json", help="JSON results file")
+    parser.add_argument(
+        "--skip-pydub",
+        action="store_true",
+        help="Skip the detectors that load the whole audio with pydub",
+    )
+    args = parser.parse_args()
+
+    benchmark_folder = os.path.join(tempfile.gettempdir(), "video_editing_benchmark")
+    os.makedirs(benchmark_folder, exist_ok=True)
+
+    report = {
+        "version": code_version(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": {},
+    }
+    for minutes in args.minutes:
+        print(
+            f"------------------------ {minutes} min recording ------------------------"
+        )
+        temp_folder = os.path.join(benchmark_folder, f"{minutes}min")
+        os.makedirs(temp_folder, exist_ok=True)
+
+        video_path, log_path = generate_recording(benchmark_folder, minutes)
+        report["results"][str(minutes)] = benchmark_recording(
+            video_path, log_path, temp_folder, args.skip_pydub
+        )
+
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=4)
+    print(f"Results saved in {args.output}")
@@ -0,0 +1,141 @@
+import shutil
+
+import numpy as np
+import pytest
+
+import utils.audio
+
+requires_ffmpeg = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None, reason="ffmpeg is not installed"
+)
+
+
+def speech_samples(sample_rate=8000, channels=1, seed=0):
+    """Noise bursts (speech) separated by quiet parts (silence), int16"""
+    rng = np.random.default_rng(seed)
+    parts = []
+    for seconds, level in [
+        (1.5, 0.3),
+        (2.2, 0.002),
+        (0.7, 0.5),
+        (3.1, 0.001),
+        (1, 0.4),
+    ]:
+        n_frames = int(seconds * sample_rate)
+        parts.append(rng.normal(0, level, (n_frames, channels)))
+    samples = np.concatenate(parts).clip(-1, 1)
+    return (samples * 32767).astype(np.int16)
+
+
+def audio_segment(samples, sample_rate):
+    from pydub import AudioSegment
+
+    return AudioSegment(
+        samples.tobytes(),
+        frame_rate=sample_rate,
+        sample_width=2,
+        channels=samples.shape[1],
+    )
+
+
+@pytest.mark.parametrize("channels", [1, 2])
+def test_detect_silence_numpy_matches_pydub(channels):
+    pytest.importorskip("pydub")
+    video_audio = audio_segment(speech_samples(channels=channels), 8000)
+
+    expected = utils.audio.detect_silence(video_audio, 1000, -40)
+    assert utils.audio.detect_silence_numpy(video_audio, 1000, -40) == expected
+    assert len(expected) == 2
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_detect_silence_numpy_matches_pydub_on_odd_lengths(seed):
+    """Sample rates without whole frames per millisecond, trailing partial
+    milliseconds and thresholds near the level of the silences"""
+    pytest.importorskip("pydub")
+    rng = np.random.default_rng(seed)
+    sample_rate = int(rng.choice([8000, 11025, 22050]))
+    samples = speech_samples(sample_rate, channels=1 + seed % 2, seed=seed)
+    n_frames = int(rng.uniform(0.5, 1.5) * sample_rate)  # silence at the end
+    tail = rng.normal(0, 0.001 * 32767, (n_frames, samples.shape[1]))
+    samples = np.concatenate([samples, tail.astype(np.int16)])
+    video_audio = audio_segment(samples, sample_rate)
+    threshold = float(rng.uniform(-60, -50))
+
+    expected = utils.audio.detect_silence(video_audio, 700, threshold)
+    events = utils.audio.detect_silence_numpy(video_audio, 700, threshold)
+    assert events == expected
+    assert all(event["talk"][0] <= event["talk"][1] for event in events)
+
+
+def test_silence_detector_chunks_match_whole():
+    samples = speech_samples().astype(np.float32) / 32768
+    energy, counts = utils.audio.block_energy(samples, 8000, 1)
+    expected = utils.audio.silent_ranges(energy, counts, 1000, -40)
+
+    # Chunks shorter and longer than the window
+    for chunk in (7, 999, 1000, 4096):
+        detector = utils.audio.SilenceDetector(1000, -40)
+        for k in range(0, len(energy), chunk):
+            detector.feed(energy[k : k + chunk], counts[k : k + chunk])
+        assert detector.finish() == expected
+
+
+@requires_ffmpeg
+def test_detect_silence_stream_matches_pydub_on_low_rate_mono(tmp_path):
+    pytest.importorskip("pydub")
+    samples = speech_samples()
+    video_audio = audio_segment(samples, 8000)
+    wav_path = str(tmp_path / "speech.wav")
+    video_audio.export(wav_path, format="wav")
+
+    # Same audio as the stream decodes: identical boundaries
+    expected = utils.audio.detect_silence(video_audio, 1000, -40)
+    assert utils.audio.detect_silence_stream(wav_path, 1000, -40, 8000) == expected
+
+
+def test_silence2events():
+    events = utils.audio.silence2events([(0, 2.0), (5.0, 6.5)], 9.0)
+    assert events == [
+        {"mode": "edit", "draw": [0, 2.0], "talk": [2.0, 5.0]},
+        {"mode": "edit", "draw": [5.0, 6.5], "talk": [6.5, 9.0]},
+    ]
+
+
+def test_silence2events_without_silence():
+    with pytest.raises(Exception, match="No silence found"):
+        utils.audio.silence2events([], 9.0)
+
+
+def constant_loudness(levels, block_seconds=10.0):
+    """Momentary loudness (100 ms blocks) with a constant level per section"""
+    momentary = np.concatenate(
+        [np.full(int(block_seconds * 10), level, dtype=float) for level in levels]
+    )
+    return {"times": (np.arange(len(momentary)) + 1) * 0.1, "momentary": momentary}
+
+
+def test_event_gains():
+    loudness = constant_loudness([-20, -26, -80])
+
+    gains = utils.audio.event_gains(loudness, [[0, 10], [10, 20]], -16, 3)
+    recording_gain = -16 - utils.audio.gated_loudness(loudness["momentary"])
+    # Each event to the target, within the range of the recording gain
+    assert gains[0] == pytest.approx(max(4.0, recording_gain - 3))
+    assert gains[1] == pytest.approx(min(10.0, recording_gain + 3))
+    # Silent events (below the absolute gate) get the gain of the recording
+    silent = utils.audio.event_gains(loudness, [[20, 30]], -16, 3)
+    assert silent == [pytest.approx(recording_gain)]
+
+
+def test_event_gains_silent_recording():
+    loudness = constant_loudness([-90])
+    assert utils.audio.event_gains(loudness, [[0, 5], [5, 10]]) == [0.0, 0.0]
+
+
+def test_apply_gain_limits_peaks():
+    samples = np.full((10, 2), 0.5, dtype=np.float32)
+
+    assert utils.audio.apply_gain(samples, -6.0)[0, 0] == pytest.approx(0.25, 1e-2)
+    louder = utils.audio.apply_gain(samples, 12.0, peak_dbfs=-1.0)
+    assert np.abs(louder).max() == pytest.approx(10 ** (-1 / 20))
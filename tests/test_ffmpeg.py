@@ -0,0 +1,39 @@
+import utils.ffmpeg
+
+KEYFRAMES = [0.0, 2.0, 4.0, 6.0, 8.0]
+
+
+def test_smart_cut_points():
+    assert utils.ffmpeg.smart_cut_points(KEYFRAMES, [0.5, 7.5]) == (2.0, 6.0)
+    # Cut points on keyframes are kept
+    assert utils.ffmpeg.smart_cut_points(KEYFRAMES, [2.0, 6.0]) == (2.0, 6.0)
+    # The crossfade is encoded anyway
+    assert utils.ffmpeg.smart_cut_points(KEYFRAMES, [0.5, 7.5], 1.5) == (2.0, 6.0)
+    assert utils.ffmpeg.smart_cut_points(KEYFRAMES, [0.5, 7.5], 1.6) == (4.0, 6.0)
+
+
+def test_smart_cut_points_without_whole_gop():
+    assert utils.ffmpeg.smart_cut_points(KEYFRAMES, [2.5, 3.5]) is None
+    assert utils.ffmpeg.smart_cut_points(KEYFRAMES, [2.5, 4.5]) is None
+    assert utils.ffmpeg.smart_cut_points([], [0.5, 7.5]) is None
+
+
+def test_decimation_options():
+    with_b_frames = {"keyframe_interval": 2.0, "has_b_frames": 2}
+    p_frames_only = {"keyframe_interval": 2.0, "has_b_frames": 0}
+
+    assert utils.ffmpeg.decimation_options(1.5, 30, media=with_b_frames) == []
+    assert utils.ffmpeg.decimation_options(4, 30, media=with_b_frames) == [
+        "-skip_frame",
+        "nonref",
+    ]
+    assert utils.ffmpeg.decimation_options(4, 30, media=p_frames_only) == []
+    assert utils.ffmpeg.decimation_options(60, 30, media=p_frames_only) == [
+        "-skip_frame",
+        "nokey",
+    ]
+    # Lower output frame rate: more source frames per output frame
+    assert utils.ffmpeg.decimation_options(30, 30, 15, p_frames_only) == [
+        "-skip_frame",
+        "nokey",
+    ]
@@ -0,0 +1,23 @@
+import pytest
+
+import utils.plan
+
+
+def test_estimate_wall_time():
+    # Longest first: 5 | 4 + 1 | 3 + 2
+    assert utils.plan.estimate_wall_time([1, 2, 3, 4, 5], 3) == 5
+    assert utils.plan.estimate_wall_time([1, 2, 3, 4, 5], 1) == 15
+    assert utils.plan.estimate_wall_time([7, 1], 8) == 7
+    assert utils.plan.estimate_wall_time([], 4) == 0
+
+
+def test_plan_roundtrip(tmp_path):
+    plan = {"version": utils.plan.PLAN_VERSION, "fps": 30.0, "events": []}
+    path = str(tmp_path / "plan.json")
+
+    utils.plan.save_plan(plan, path)
+    assert utils.plan.load_plan(path) == plan
+
+    utils.plan.save_plan(dict(plan, version=0), path)
+    with pytest.raises(Exception, match="Unsupported render plan version"):
+        utils.plan.load_plan(path)
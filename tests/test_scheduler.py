@@ -0,0 +1,50 @@
+import concurrent.futures
+import threading
+
+import pytest
+
+import utils.scheduler
+
+
+def test_shared_queue_runs_longest_pending_first():
+    started = threading.Event()
+    release = threading.Event()
+    order = []
+
+    def blocker():
+        started.set()
+        release.wait(5)
+
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        queue = utils.scheduler.SharedQueue(executor, 1)
+        first = queue.submit(0, blocker)
+        started.wait(5)
+        # Submitted by different videos while the only worker is busy
+        futures = [queue.submit(cost, order.append, cost) for cost in (1, 5, 3)]
+        release.set()
+        concurrent.futures.wait([first] + futures, timeout=5)
+        queue.close()
+
+    assert order == [5, 3, 1]
+
+
+def test_shared_queue_propagates_errors():
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        queue = utils.scheduler.SharedQueue(executor, 2)
+        future = queue.submit(1, int, "not a number")
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+        queue.close()
+
+
+def test_run_events_with_shared_queue():
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        queue = utils.scheduler.SharedQueue(executor, 2)
+        done = []
+        results = utils.scheduler.run_events(
+            pow, [(2, 3), (3, 2)], [1.0, 2.0], 2, on_done=done.append, queue=queue
+        )
+        queue.close()
+
+    assert results == [8, 9]
+    assert sorted(done) == [0, 1]
@@ -0,0 +1,66 @@
+import pickle
+
+import numpy as np
+import pytest
+
+import utils.timeline
+
+
+def test_snap_events_to_frame_grid():
+    events = [
+        {"mode": "edit", "draw": [0.01, 2.49], "talk": [2.49, 4.0]},
+        {"mode": "raw", "both": [4.0, 7.333], "offset": 1.02},
+    ]
+    edit, raw = utils.timeline.snap_events(events, 30)
+
+    assert edit.frames == (0, 75, 75, 120)
+    assert edit["draw"] == (0.0, 2.5)
+    assert edit.n_frames("talk") == 45
+    assert raw.frames == (120, 220)
+    assert raw.offset_frames == 31
+    assert raw["offset"] == pytest.approx(31 / 30)
+    assert raw.segment_times() == (4.0, 220 / 30)
+
+
+def test_event_is_immutable_and_picklable():
+    event = utils.timeline.Event("edit", [30, 90, 90, 151], 29.97, 12)
+
+    with pytest.raises(AttributeError):
+        event.mode = "raw"
+    copy = pickle.loads(pickle.dumps(event))
+    assert copy == event
+    assert hash(copy) == hash(event)
+    assert repr(copy) == repr(event)
+    assert event.with_offset(0.5).offset_frames == 15
+
+
+def test_event_validation():
+    with pytest.raises(Exception, match="Unkown event mode"):
+        utils.timeline.Event("both", [0, 1], 30)
+    with pytest.raises(Exception, match="Wrong number of boundaries"):
+        utils.timeline.Event("raw", [0, 1, 2, 3], 30)
+
+
+def test_section_samples_follow_the_frames():
+    event = utils.timeline.Event("edit", [30, 90, 90, 151], 29.97)
+
+    start, end = event.section_samples("talk", 44100, origin_frame=30)
+    assert (start, end) == (round(60 * 44100 / 29.97), round(121 * 44100 / 29.97))
+    # Consecutive sections share their boundary sample
+    assert event.section_samples("draw", 44100, 30)[1] == start
+
+
+def test_pad_to_frames():
+    samples = np.ones((44100 + 10, 2), dtype=np.float32)
+    padded, n_frames = utils.timeline.pad_to_frames(samples, 44100, 30)
+
+    assert n_frames == 31
+    assert len(padded) == round(31 * 44100 / 30)
+    assert padded.dtype == np.float32
+    assert not padded[len(samples) :].any()
+
+    # Already a whole number of frames: unchanged
+    exact = np.ones((1470 * 3, 1), dtype=np.float32)
+    padded, n_frames = utils.timeline.pad_to_frames(exact, 44100, 30)
+    assert n_frames == 3
+    assert len(padded) == len(exact)
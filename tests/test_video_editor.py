@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import utils.timeline
+import video_editor
+
+
+def test_capped_speedup():
+    param = {"MAX_SPEEDX": 5}
+
+    assert video_editor.capped_speedup(12.0, 4.0, param) == (3.0, 4.0)
+    # Capped: the output lasts longer than the audio
+    speedup, duration = video_editor.capped_speedup(30.0, 2.0, param)
+    assert speedup == 5
+    assert duration == pytest.approx(6.0)
+
+
+def test_pad_audio():
+    samples = np.ones((100, 2), dtype=np.float32)
+
+    padded = video_editor.pad_audio(samples, 1.5, 100)
+    assert padded.shape == (150, 2)
+    assert padded.dtype == np.float32
+    assert not padded[100:].any()
+    assert video_editor.pad_audio(samples, 0.5, 100) is samples
+
+
+def test_smart_cut_allowed():
+    param = dict(video_editor.param, SMART_CUT=True)
+    profiles = video_editor.param["RENDER_PROFILES"]
+    media = {"video_codec": "h264", "profile": "High", "pix_fmt": "yuv420p"}
+
+    assert video_editor.smart_cut_allowed(media, profiles["final"], param)
+    assert not video_editor.smart_cut_allowed(media, profiles["preview"], param)
+    for key, value in [("profile", "Main"), ("pix_fmt", "yuv444p")]:
+        assert not video_editor.smart_cut_allowed(
+            dict(media, **{key: value}), profiles["final"], param
+        )
+
+
+def test_timeline_item_lasts_whole_frames():
+    param = dict(video_editor.param, REMOVE_COLOUR_PALETTE=False, MAX_SPEEDX=100)
+    fps = 30
+    edit = utils.timeline.Event("edit", [0, 1000, 1000, 1077], fps)
+    raw = utils.timeline.Event("raw", [1077, 1200], fps)
+
+    for i, event in enumerate([edit, raw]):
+        item = video_editor.timeline_item(i, 3, event, None, "source.mp4", fps, param)
+        n_frames = item["duration"] * fps
+        assert n_frames == pytest.approx(round(n_frames))
+        audio_duration = video_editor.edited_audio_duration(i, 3, event, param)
+        assert item["duration"] > audio_duration - 1e-9
+        video_duration = item["end"] - item["start"] + item["extend_duration"]
+        assert video_duration / item["speedup"] == pytest.approx(item["duration"])
@@ -0,0 +1,48 @@
+import shutil
+import subprocess
+
+import pytest
+
+import utils.ffmpeg
+import utils.watch
+
+requires_ffmpeg = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None, reason="ffmpeg is not installed"
+)
+
+
+def test_read_log_lines_leaves_partial_line(tmp_path):
+    log_path = tmp_path / "log.txt"
+    log_path.write_text("00:00:01,draw\n00:00:05,talk\n00:00:0")
+
+    rows, position = utils.watch.read_log_lines(str(log_path), 0)
+    assert rows == [["00:00:01", "draw"], ["00:00:05", "talk"]]
+
+    with open(log_path, "a") as file:
+        file.write("9,stop\n")
+    rows, position = utils.watch.read_log_lines(str(log_path), position)
+    assert rows == [["00:00:09", "stop"]]
+    assert position == log_path.stat().st_size
+
+
+def test_read_log_lines_missing_file(tmp_path):
+    assert utils.watch.read_log_lines(str(tmp_path / "log.txt"), 7) == ([], 7)
+
+
+@requires_ffmpeg
+def test_simulate_obs(tmp_path):
+    source = str(tmp_path / "source.mp4")
+    command = ["ffmpeg", "-y", "-f", "lavfi", "-i", "testsrc=size=320x240:rate=10"]
+    command += ["-f", "lavfi", "-i", "sine", "-t", "4", "-g", "10", source]
+    subprocess.run(command, capture_output=True, check=True)
+
+    log_rows = [["00:00:00", "draw"], ["00:00:02", "talk"], ["00:00:03", "stop"]]
+    video_path = str(tmp_path / "recording.mkv")
+    log_path = str(tmp_path / "log.txt")
+    utils.watch.simulate_obs(source, log_rows, video_path, log_path, speed=8.0)
+
+    rows, _ = utils.watch.read_log_lines(log_path, 0)
+    assert rows == log_rows
+    assert utils.ffmpeg.media_duration(video_path) == pytest.approx(4, abs=0.2)
+    # Only the packets after the known duration are read
+    assert utils.ffmpeg.media_duration(video_path, 3.0) >= 3.0
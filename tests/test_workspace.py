@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+import utils.workspace
+
+
+def touch(path, n_bytes=10):
+    with open(path, "wb") as file:
+        file.write(b"0" * n_bytes)
+
+
+def test_consumed_deletes_after_last_consumer(tmp_path):
+    with utils.workspace.Workspace(str(tmp_path), tmpfs=False) as workspace:
+        segment = workspace.path("video_segment_0.mp4")
+        output = workspace.path("output0.mp4")
+        touch(segment)
+        touch(output)
+        workspace.produced(segment, [("event", 0), ("event", 1)])
+        workspace.produced(output, ["concat"])
+
+        workspace.consumed(("event", 0))
+        assert os.path.exists(segment)
+        workspace.consumed(("event", 1))
+        assert not os.path.exists(segment)
+        assert os.path.exists(output)
+
+        # Unknown consumers and files that were never written are ignored
+        workspace.produced(workspace.path("proxy.mkv"), ["concat"])
+        workspace.consumed(("event", 7))
+        workspace.consumed("concat")
+        assert not os.path.exists(output)
+        assert workspace.peak_bytes == 20
+        folder = workspace.folder
+
+    assert not os.path.exists(folder)
+
+
+def test_reserve_over_budget(tmp_path):
+    with utils.workspace.Workspace(
+        str(tmp_path), budget_bytes=100, tmpfs=False
+    ) as workspace:
+        touch(workspace.path("video_segment_0.mp4"), 60)
+        workspace.reserve(40, "the segments")
+        with pytest.raises(Exception, match="Workspace budget exceeded"):
+            workspace.reserve(41, "the segments")
+
+
+def test_closed_on_error(tmp_path):
+    with pytest.raises(KeyError):
+        with utils.workspace.Workspace(str(tmp_path)) as workspace:
+            folders = [workspace.folder, workspace.hot_folder]
+            raise KeyError
+    assert not any(os.path.exists(folder) for folder in folders)
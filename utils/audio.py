@@ -1,7 +1,14 @@
-import pydub
+import os
+import re
+import subprocess
+import time
+
+import numpy as np
 
 
 def detect_silence(video_audio, min_silence_ms, silence_threshold_db):
+    import pydub.silence
+
     print("INFO: Detecting silence...")
     silence_segments = pydub.silence.detect_silence(
         video_audio, min_silence_len=min_silence_ms, silence_thresh=silence_threshold_db
@@ -10,7 +17,66 @@ def detect_silence(video_audio, min_silence_ms, silence_threshold_db):
         ((start / 1000), (stop / 1000)) for start, stop in silence_segments
     ]  # convert to sec
 
+    return silence2events(silence_seconds, len(video_audio) / 1000)
+
+
+def detect_silence_numpy(video_audio, min_silence_ms, silence_threshold_db, step_ms=1):
+    """Same as detect_silence but computes the windowed RMS with NumPy (cumulative
+    sum of squares) instead of the pure-Python loop of pydub
+
+    Args:
+        video_audio (AudioSegment): audio to be analysed
+        min_silence_ms (int): minimum length of a silence in milliseconds
+        silence_threshold_db (float): silence threshold in dBFS
+        step_ms (int, optional): resolution of the search in milliseconds. Defaults to 1.
+
+    Returns:
+        list of dictionaries: same event list as detect_silence
+    """
+    print("INFO: Detecting silence (numpy)...")
+    samples, sample_rate = audio2array(video_audio)
+    energy, counts = block_energy(samples, sample_rate, step_ms)
+
+    # pydub slices whole milliseconds up to len(video_audio) (rounded): the partial
+    # block after it is not searched, the frames missing in the last one are
+    # silence and silences end with the audio
+    duration_ms = len(video_audio)
+    n_blocks = int(np.ceil(duration_ms / step_ms))
+    energy, counts = energy[:n_blocks], counts[:n_blocks].copy()
+    missing_frames = int(duration_ms * (sample_rate / 1000)) - len(samples)
+    if len(counts) and missing_frames > 0:
+        counts[-1] += missing_frames * samples.shape[1]
+    silence_blocks = silent_ranges(
+        energy,
+        counts,
+        int(np.ceil(min_silence_ms / step_ms)),
+        silence_threshold_db,
+        video_audio.max_possible_amplitude,
+    )
+    silence_seconds = [
+        ((start * step_ms / 1000), (min(stop * step_ms, duration_ms) / 1000))
+        for start, stop in silence_blocks
+    ]
+
+    return silence2events(silence_seconds, len(video_audio) / 1000)
+
+
+def silence2events(silence_seconds, audio_duration):
+    """Converts silence intervals into the event list (draw on silence, talk in between)
+
+    Args:
+        silence_seconds (list of tuples): (start, stop) of each silence in seconds
+        audio_duration (float): audio duration in seconds
+
+    Returns:
+        list of dictionaries: each element of the list is an "edit" part of the final video
+    """
     # Extraced silence metrics and warnings
+    if not silence_seconds:
+        raise Exception(
+            "No silence found in the audio, lower MIN_SILENCE_MS or raise the "
+            "silence threshold"
+        )
     if silence_seconds[0][0] != 0:
         print("WARNING!: First silence does NOT start at 0.0")
 
@@ -27,12 +93,632 @@ def detect_silence(video_audio, min_silence_ms, silence_threshold_db):
         previous_silence_end = el[1]
 
     output[-1]["talk"][0] = previous_silence_end
-    output[-1]["talk"][1] = len(video_audio) / 1000
+    output[-1]["talk"][1] = audio_duration
 
     return output
 
 
+def audio2array(video_audio):
+    """Converts an AudioSegment into a float array normalised to [-1, 1]
+
+    Returns:
+        tuple: (samples with shape (n_frames, channels), sample rate)
+    """
+    samples = np.array(video_audio.get_array_of_samples(), dtype=np.float32)
+    samples /= video_audio.max_possible_amplitude
+    return samples.reshape(-1, video_audio.channels), video_audio.frame_rate
+
+
+def block_energy(samples, sample_rate, block_ms):
+    """Sum of squares (all channels) and number of samples of each block of audio
+
+    Args:
+        samples (np.array): normalised samples with shape (n_frames, channels)
+        sample_rate (int): frames per second
+        block_ms (int): block length in milliseconds
+
+    Returns:
+        tuple of np.array: (energy, counts) of each block
+    """
+    if len(samples) == 0:
+        return np.zeros(0), np.zeros(0, dtype=np.int64)
+
+    # Block boundaries in frames, truncated like pydub slices do
+    n_blocks = int(np.ceil(len(samples) * 1000 / sample_rate / block_ms))
+    bounds = np.floor(np.arange(n_blocks) * block_ms * (sample_rate / 1000))
+    bounds = np.unique(bounds.astype(np.int64).clip(max=len(samples) - 1))
+
+    squares = np.square(samples, dtype=np.float64).sum(axis=1)
+    energy = np.add.reduceat(squares, bounds)
+    counts = np.diff(np.append(bounds, len(samples))) * samples.shape[1]
+    return energy, counts
+
+
+def silent_ranges(
+    energy, counts, window_blocks, silence_threshold_db, max_amplitude=None
+):
+    """Finds the silences in a sequence of blocks, same criteria as pydub: a window of
+    window_blocks starting at each block is silent if its RMS is below the threshold,
+    and overlapping silent windows are merged
+
+    Args:
+        energy (np.array): sum of squares of each block
+        counts (np.array): number of samples of each block
+        window_blocks (int): minimum silence length in blocks
+        silence_threshold_db (float): silence threshold in dBFS
+        max_amplitude (int, optional): maximum amplitude of the integer samples the
+                                       energy comes from, None for float samples.
+                                       Defaults to None.
+
+    Returns:
+        list of tuples: (start, stop) of each silence in blocks
+    """
+    detector = SilenceDetector(window_blocks, silence_threshold_db, max_amplitude)
+    detector.feed(energy, counts)
+    return detector.finish()
+
+
+class SilenceDetector:
+    """Silence state machine that can be fed with consecutive chunks of blocks, only
+    the last window_blocks - 1 blocks are kept between chunks. With max_amplitude
+    (integer samples) the RMS is truncated to an integer before the comparison, as
+    pydub does (audioop.rms)"""
+
+    def __init__(self, window_blocks, silence_threshold_db, max_amplitude=None):
+        self.window_blocks = window_blocks
+        self.threshold = 10 ** (silence_threshold_db / 20)
+        self.max_amplitude = max_amplitude
+        self.tail_energy = np.zeros(0)
+        self.tail_counts = np.zeros(0, dtype=np.int64)
+        self.n_blocks = 0  # blocks fed so far
+        self.current = None  # [start, last silent window start] of the open silence
+        self.ranges = []
+
+    def feed(self, energy, counts):
+        offset = self.n_blocks - len(self.tail_energy)  # index of energy[0]
+        self.n_blocks += len(energy)
+        energy = np.concatenate((self.tail_energy, energy))
+        counts = np.concatenate((self.tail_counts, counts))
+
+        w = self.window_blocks
+        keep = min(w - 1, len(energy))
+        self.tail_energy = energy[len(energy) - keep :]
+        self.tail_counts = counts[len(counts) - keep :]
+        if len(energy) < w:
+            return
+
+        cum_energy = np.concatenate(([0.0], np.cumsum(energy)))
+        cum_counts = np.concatenate(([0], np.cumsum(counts)))
+        window_energy = cum_energy[w:] - cum_energy[:-w]
+        window_counts = cum_counts[w:] - cum_counts[:-w]
+        rms = np.sqrt(window_energy / np.maximum(window_counts, 1))
+        threshold = self.threshold
+        if self.max_amplitude is not None:
+            rms = np.floor(rms * self.max_amplitude + 1e-6)
+            threshold *= self.max_amplitude
+
+        silent_starts = np.flatnonzero(rms <= threshold) + offset
+        if len(silent_starts) == 0:
+            return
+
+        # Overlapping windows belong to the same silence
+        gaps = np.flatnonzero(np.diff(silent_starts) > w)
+        run_starts = silent_starts[np.concatenate(([0], gaps + 1))].tolist()
+        run_lasts = silent_starts[np.append(gaps, len(silent_starts) - 1)].tolist()
+
+        for start, last in zip(run_starts, run_lasts):
+            if self.current is not None and start <= self.current[1] + w:
+                self.current[1] = last
+                continue
+            self._close()
+            self.current = [start, last]
+
+    def finish(self):
+        """Closes the open silence (if any)
+
+        Returns:
+            list of tuples: (start, stop) of each silence in blocks
+        """
+        self._close()
+        return self.ranges
+
+    def _close(self):
+        if self.current is not None:
+            self.ranges.append((self.current[0], self.current[1] + self.window_blocks))
+            self.current = None
+
+
+def detect_silence_stream(
+    video_path,
+    min_silence_ms,
+    silence_threshold_db,
+    sample_rate=8000,
+    step_ms=1,
+    chunk_seconds=10,
+    debug=False,
+):
+    """Same as detect_silence but the audio is decoded by ffmpeg as low sample rate
+    mono PCM and analysed chunk by chunk, so memory does not grow with the video length
+
+    Args:
+        video_path (str): path to the video (or audio) file
+        min_silence_ms (int): minimum length of a silence in milliseconds
+        silence_threshold_db (float): silence threshold in dBFS
+        sample_rate (int, optional): decoding sample rate. Defaults to 8000.
+        step_ms (int, optional): resolution of the search in milliseconds. Defaults to 1.
+        chunk_seconds (int, optional): audio read from ffmpeg at once. Defaults to 10.
+
+    Returns:
+        list of dictionaries: same event list as detect_silence
+    """
+    print("INFO: Detecting silence (stream)...")
+    detector = SilenceDetector(
+        int(np.ceil(min_silence_ms / step_ms)), silence_threshold_db
+    )
+    n_frames = 0
+    for energy, counts, n_chunk_frames in stream_block_energy(
+        video_path, sample_rate, step_ms, chunk_seconds, debug
+    ):
+        detector.feed(energy, counts)
+        n_frames += n_chunk_frames
+
+    # The last block can be partial, silences end with the audio
+    duration = n_frames / sample_rate
+    silence_seconds = [
+        ((start * step_ms / 1000), min(stop * step_ms / 1000, duration))
+        for start, stop in detector.finish()
+    ]
+
+    return silence2events(silence_seconds, duration)
+
+
+def stream_block_energy(
+    video_path, sample_rate=8000, step_ms=1, chunk_seconds=10, debug=False
+):
+    """Decodes the audio with ffmpeg as low sample rate mono PCM and yields the block
+    energy (see block_energy) chunk by chunk
+
+    Args:
+        video_path (str): path to the video (or audio) file
+        sample_rate (int, optional): decoding sample rate. Defaults to 8000.
+        step_ms (int, optional): block length in milliseconds. Defaults to 1.
+        chunk_seconds (int, optional): audio read from ffmpeg at once. Defaults to 10.
+
+    Yields:
+        tuple: (energy, counts, number of frames) of each chunk
+    """
+    frames_per_block = sample_rate * step_ms / 1000
+    if frames_per_block != int(frames_per_block):
+        raise Exception(
+            f"{step_ms} ms is not a whole number of frames at {sample_rate} Hz"
+        )
+    frames_per_block = int(frames_per_block)
+    blocks_per_chunk = max(int(chunk_seconds * 1000 / step_ms), 1)
+    chunk_bytes = blocks_per_chunk * frames_per_block * 2  # 16 bits per sample
+
+    command = [
+        "ffmpeg",
+        "-i",
+        f"{video_path}",
+        "-vn",  # no video
+        "-ac",
+        "1",  # mono
+        "-ar",
+        f"{sample_rate}",
+        "-f",
+        "s16le",
+        "-acodec",
+        "pcm_s16le",
+        "-",  # output to stdout
+    ]
+    if debug:
+        buf = None  # print to terminal
+    else:
+        buf = subprocess.DEVNULL
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=buf)
+
+    while True:
+        data = process.stdout.read(chunk_bytes)
+        if not data:
+            break
+        samples = np.frombuffer(data[: len(data) // 2 * 2], dtype=np.int16)
+        samples = samples.astype(np.float32).reshape(-1, 1) / 32768
+        energy, counts = block_energy(samples, sample_rate, step_ms)
+        yield energy, counts, len(samples)
+    process.stdout.close()
+    if process.wait() != 0:
+        raise Exception(f"ffmpeg failed decoding the audio of {video_path}")
+
+
+def envelope_path(video_path):
+    """Loudness envelope cache, saved next to the recording"""
+    return f"{video_path}.envelope.npz"
+
+
+def audio_envelope(video_path, sample_rate=8000, step_ms=10, decode_path=None):
+    """Loudness envelope of a recording (energy of each step_ms block), decoded once
+    and cached next to the recording so the silences can be searched again with any
+    threshold or minimum length without decoding the audio
+
+    Args:
+        video_path (str): path to the recording
+        sample_rate (int, optional): decoding sample rate. Defaults to 8000.
+        step_ms (int, optional): block length in milliseconds. Defaults to 10.
+        decode_path (str, optional): file with the same audio that is faster to decode
+                                     (i.e. a proxy), None is the recording. Defaults to None.
+
+    Returns:
+        dict: "energy" and "counts" of each block, "step_ms" and "duration" (seconds)
+    """
+    stat = os.stat(video_path)
+    identity = np.array([stat.st_size, stat.st_mtime_ns, sample_rate, step_ms])
+    cache_path = envelope_path(video_path)
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            if np.array_equal(data["identity"], identity):
+                print("INFO: Loudness envelope loaded from cache")
+                return {
+                    "energy": data["energy"],
+                    "counts": data["counts"],
+                    "step_ms": step_ms,
+                    "duration": float(data["duration"]),
+                }
+
+    print("INFO: Computing loudness envelope...")
+    chunks = list(stream_block_energy(decode_path or video_path, sample_rate, step_ms))
+    envelope = {
+        "energy": np.concatenate([chunk[0] for chunk in chunks] or [np.zeros(0)]),
+        "counts": np.concatenate(
+            [chunk[1] for chunk in chunks] or [np.zeros(0, dtype=np.int64)]
+        ),
+        "step_ms": step_ms,
+        "duration": sum(chunk[2] for chunk in chunks) / sample_rate,
+    }
+    try:
+        with open(cache_path, "wb") as file:
+            np.savez(
+                file,
+                identity=identity,
+                energy=envelope["energy"],
+                counts=envelope["counts"],
+                duration=envelope["duration"],
+            )
+    except OSError:
+        print(f"WARNING: Can't save the loudness envelope in {cache_path}")
+
+    return envelope
+
+
+def envelope_levels(envelope, smooth_ms=200):
+    """Loudness (dBFS) of each block of an envelope, RMS over smooth_ms centred windows"""
+    w = max(int(round(smooth_ms / envelope["step_ms"])), 1)
+    cum_energy = np.concatenate(([0.0], np.cumsum(envelope["energy"])))
+    cum_counts = np.concatenate(([0], np.cumsum(envelope["counts"])))
+    n = len(envelope["energy"])
+    lo = np.clip(np.arange(n) - w // 2, 0, n)
+    hi = np.clip(np.arange(n) + w - w // 2, 0, n)
+    mean_square = (cum_energy[hi] - cum_energy[lo]) / np.maximum(
+        cum_counts[hi] - cum_counts[lo], 1
+    )
+    return 10 * np.log10(np.maximum(mean_square, 1e-12))
+
+
+def adaptive_thresholds(levels, noise_percentile=10, speech_percentile=90):
+    """Silence thresholds derived from the loudness distribution of the recording:
+    silence starts below the low threshold and ends above the high one (hysteresis)
+
+    Args:
+        levels (np.array): loudness of each block in dBFS (see envelope_levels)
+        noise_percentile (float, optional): percentile of the noise floor. Defaults to 10.
+        speech_percentile (float, optional): percentile of the speech. Defaults to 90.
+
+    Returns:
+        tuple of floats: (low, high) thresholds in dBFS
+    """
+    noise_db, speech_db = np.percentile(levels, [noise_percentile, speech_percentile])
+    spread = max(speech_db - noise_db, 6)  # dB, recordings without speech
+    return noise_db + 0.3 * spread, noise_db + 0.5 * spread
+
+
+def hysteresis_silences(levels, low_db, high_db, min_blocks):
+    """Silences of at least min_blocks blocks, a silence starts when the level goes
+    below low_db and ends when it goes above high_db (the recording starts silent)
+
+    Returns:
+        list of tuples: (start, stop) of each silence in blocks
+    """
+    below = levels < low_db
+    above = levels > high_db
+    n = len(levels)
+
+    # State of each block: the last crossing (below or above) before it
+    last = np.where(below | above, np.arange(n), -1)
+    last = np.maximum.accumulate(last) if n else last
+    silent = np.where(last >= 0, below[np.maximum(last, 0)], True)
+
+    flags = np.concatenate(([False], silent, [False])).astype(np.int8)
+    changes = np.diff(flags)
+    starts = np.flatnonzero(changes == 1)
+    stops = np.flatnonzero(changes == -1)
+    return [
+        (start, stop)
+        for start, stop in zip(starts.tolist(), stops.tolist())
+        if stop - start >= min_blocks
+    ]
+
+
+def detect_silence_envelope(envelope, min_silence_ms, silence_threshold_db=None):
+    """Silence detection on a cached envelope (milliseconds, no decoding), with a fixed
+    threshold (same criteria as detect_silence) or adaptive thresholds if it is None
+
+    Args:
+        envelope (dict): loudness envelope (see audio_envelope)
+        min_silence_ms (int): minimum length of a silence in milliseconds
+        silence_threshold_db (float, optional): silence threshold in dBFS, None computes
+                                                it from the recording. Defaults to None.
+
+    Returns:
+        list of dictionaries: same event list as detect_silence
+    """
+    step_ms = envelope["step_ms"]
+    min_blocks = int(np.ceil(min_silence_ms / step_ms))
+    if silence_threshold_db is None:
+        levels = envelope_levels(envelope)
+        low_db, high_db = adaptive_thresholds(levels)
+        print(f"INFO: Adaptive silence thresholds: {low_db:.1f} / {high_db:.1f} dBFS")
+        silence_blocks = hysteresis_silences(levels, low_db, high_db, min_blocks)
+    else:
+        silence_blocks = silent_ranges(
+            envelope["energy"], envelope["counts"], min_blocks, silence_threshold_db
+        )
+    silence_seconds = [
+        ((start * step_ms / 1000), (stop * step_ms / 1000))
+        for start, stop in silence_blocks
+    ]
+
+    return silence2events(silence_seconds, envelope["duration"])
+
+
+def loudness_path(video_path):
+    """Momentary loudness cache (EBU R128), saved next to the recording"""
+    return f"{video_path}.loudness.npz"
+
+
+def momentary_loudness(video_path, debug=False):
+    """Momentary loudness (EBU R128, 400 ms blocks every 100 ms) of a recording, from
+    the ffmpeg ebur128 filter in a single audio pass, cached next to the recording
+
+    Args:
+        video_path (str): path to the recording
+
+    Returns:
+        dict: "times" (end of each block in seconds) and "momentary" (LUFS)
+    """
+    stat = os.stat(video_path)
+    identity = np.array([stat.st_size, stat.st_mtime_ns])
+    cache_path = loudness_path(video_path)
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            if np.array_equal(data["identity"], identity):
+                print("INFO: Loudness loaded from cache")
+                return {"times": data["times"], "momentary": data["momentary"]}
+
+    print("INFO: Measuring loudness...")
+    command = [
+        "ffmpeg",
+        "-nostats",
+        "-i",
+        f"{video_path}",
+        "-vn",
+        "-af",
+        "ebur128",
+        "-f",
+        "null",
+        "-",
+    ]
+    process = subprocess.run(command, capture_output=True, text=True)
+    if process.returncode != 0:
+        if debug:
+            print(process.stderr)
+        raise Exception(f"ffmpeg failed measuring the loudness of {video_path}")
+
+    pattern = re.compile(r"t:\s*([-\d.]+)\s+TARGET:.*?M:\s*(-?[\d.]+|-?inf|nan)")
+    rows = [match.groups() for match in pattern.finditer(process.stderr)]
+    loudness = {
+        "times": np.array([float(t) for t, _ in rows]),
+        "momentary": np.array([float(m) for _, m in rows]),
+    }
+    try:
+        with open(cache_path, "wb") as file:
+            np.savez(file, identity=identity, **loudness)
+    except OSError:
+        print(f"WARNING: Can't save the loudness in {cache_path}")
+
+    return loudness
+
+
+def gated_loudness(momentary):
+    """Integrated loudness (LUFS) of momentary blocks with the EBU R128 gates (absolute
+    -70 LUFS, relative -10 LU), -inf if no block passes them"""
+    momentary = momentary[momentary > -70]
+    if len(momentary) == 0:
+        return -np.inf
+    energy = 10 ** ((momentary + 0.691) / 10)
+    relative_gate = -0.691 + 10 * np.log10(energy.mean()) - 10
+    energy = energy[momentary > relative_gate]
+    return -0.691 + 10 * np.log10(energy.mean())
+
+
+def event_gains(loudness, intervals, target_lufs=-16, event_range_db=3):
+    """Gain of each event that brings its speech to the target loudness, each gain is
+    kept within event_range_db of the gain of the whole recording (quiet events are
+    not boosted into noise)
+
+    Args:
+        loudness (dict): momentary loudness of the recording (see momentary_loudness)
+        intervals (list): [start, end] of the speech of each event (seconds)
+        target_lufs (float, optional): loudness of the result. Defaults to -16.
+        event_range_db (float, optional): maximum deviation from the recording gain.
+                                          Defaults to 3.
+
+    Returns:
+        list of floats: gain of each event in dB
+    """
+    times, momentary = loudness["times"], loudness["momentary"]
+    recording = gated_loudness(momentary)
+    if not np.isfinite(recording):
+        return [0.0] * len(intervals)
+    recording_gain = target_lufs - recording
+
+    gains = []
+    for t_start, t_end in intervals:
+        # Blocks that lie inside the interval (each block covers the previous 400 ms)
+        blocks = momentary[
+            np.searchsorted(times, t_start + 0.4) : np.searchsorted(
+                times, t_end, "right"
+            )
+        ]
+        event = gated_loudness(blocks)
+        gain = target_lufs - event if np.isfinite(event) else recording_gain
+        gains.append(
+            float(
+                np.clip(
+                    gain,
+                    recording_gain - event_range_db,
+                    recording_gain + event_range_db,
+                )
+            )
+        )
+    return gains
+
+
+def apply_gain(samples, gain_db, peak_dbfs=-1.0):
+    """Applies a gain in dB, reduced if the peaks would go above peak_dbfs"""
+    if len(samples) == 0:
+        return samples
+    gain = 10 ** (gain_db / 20)
+    ceiling = 10 ** (peak_dbfs / 20)
+    peak = np.abs(samples).max() * gain
+    if peak > ceiling:
+        gain *= ceiling / peak
+    return samples * np.float32(gain)
+
+
 def print_audio_info(video_audio):
     print(f"INFO: RMS (dB): {video_audio.dBFS:.2f}")
     print(f"INFO: Audio max dBFS: {video_audio.max_dBFS:.2f}")
-    print(f"INFO: Audio duration: {video_audio.duration_seconds:.2f} seconds")
\ No newline at end of file
+    print(f"INFO: Audio duration: {video_audio.duration_seconds:.2f} seconds")
+
+
+def decode_audio(
+    path, sample_rate=44100, channels=2, t_start=None, duration=None, debug=False
+):
+    """Decodes the audio of a file once into memory (ffmpeg pipe, no temporary files)
+
+    Args:
+        path (str): path to the video (or audio) file
+        sample_rate (int, optional): decoding sample rate. Defaults to 44100.
+        channels (int, optional): number of channels. Defaults to 2.
+        t_start (float, optional): start time in seconds, None is the beginning.
+                                   Defaults to None.
+        duration (float, optional): seconds decoded, None is until the end.
+                                    Defaults to None.
+
+    Returns:
+        np.array: float32 samples normalised to [-1, 1] with shape (n_frames, channels)
+    """
+    command = ["ffmpeg"]
+    if t_start is not None:
+        command += ["-ss", f"{t_start}"]
+    if duration is not None:
+        command += ["-t", f"{duration}"]
+    command += [
+        "-i",
+        f"{path}",
+        "-vn",  # no video
+        "-ac",
+        f"{channels}",
+        "-ar",
+        f"{sample_rate}",
+        "-f",
+        "f32le",
+        "-acodec",
+        "pcm_f32le",
+        "-",  # output to stdout
+    ]
+    if debug:
+        buf = None  # print to terminal
+    else:
+        buf = subprocess.DEVNULL
+    output = subprocess.run(command, stdout=subprocess.PIPE, stderr=buf, check=True)
+
+    return np.frombuffer(output.stdout, dtype=np.float32).reshape(-1, channels).copy()
+
+
+def ms2frames(milliseconds, sample_rate):
+    return int(round(milliseconds * sample_rate / 1000))
+
+
+def silent(duration_ms, sample_rate, channels):
+    """Same as AudioSegment.silent for sample arrays"""
+    return np.zeros((ms2frames(duration_ms, sample_rate), channels), dtype=np.float32)
+
+
+def normalize(samples, headroom_db=0.1):
+    """Same as pydub effects.normalize for sample arrays (peak normalisation)"""
+    peak = np.abs(samples).max() if len(samples) else 0
+    if peak == 0:
+        return samples
+    return samples * np.float32(10 ** (-headroom_db / 20) / peak)
+
+
+def fade(samples, sample_rate, fade_in_ms, fade_out_ms):
+    """Linear fade in and fade out (same as AudioSegment.fade_in / fade_out)"""
+    samples = samples.copy()
+    n_in = min(ms2frames(fade_in_ms, sample_rate), len(samples))
+    n_out = min(ms2frames(fade_out_ms, sample_rate), len(samples))
+    if n_in:
+        samples[:n_in] *= np.linspace(0, 1, n_in, dtype=np.float32)[:, None]
+    if n_out:
+        samples[len(samples) - n_out :] *= np.linspace(1, 0, n_out, dtype=np.float32)[
+            :, None
+        ]
+    return samples
+
+
+if __name__ == "__main__":
+    import pydub
+    from pydub.generators import Sine
+
+    # Benchmark: pydub vs numpy silence detection with a synthetic lecture
+    # (silent drawing sections followed by talking sections)
+    min_silence_ms = 5000
+    silence_threshold_db = -40
+    step_ms = 1
+    for minutes in [1, 5]:
+        video_audio = pydub.AudioSegment.empty()
+        while video_audio.duration_seconds < minutes * 60:
+            video_audio += pydub.AudioSegment.silent(duration=8000, frame_rate=44100)
+            video_audio += Sine(440).to_audio_segment(duration=12000, volume=-20)
+
+        start = time.time()
+        events_pydub = detect_silence(video_audio, min_silence_ms, silence_threshold_db)
+        time_pydub = time.time() - start
+
+        start = time.time()
+        events_numpy = detect_silence_numpy(
+            video_audio, min_silence_ms, silence_threshold_db, step_ms
+        )
+        time_numpy = time.time() - start
+
+        window = step_ms / 1000  # results must match within one window
+        same = len(events_pydub) == len(events_numpy) and all(
+            abs(a[key][j] - b[key][j]) <= window
+            for a, b in zip(events_pydub, events_numpy)
+            for key in ["draw", "talk"]
+            for j in range(2)
+        )
+        print(
+            f"{minutes:3} min - pydub: {time_pydub:.2f} s - numpy: {time_numpy:.2f} s"
+            f" - match: {same}"
+        )
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+# Bump when a change in the code modifies the rendered files
+CODE_VERSION = 4
+
+# Parameters that modify each stage output
+AUDIO_PARAMETERS = [
+    "NORMALISE_SOUND",
+    "LOUDNESS_PEAK_dBFS",
+    "AUDIO_SAMPLE_RATE",
+    "SILENCE_BETWEEN_SECTIONS",
+    "START_VIDEO_SILENCE",
+    "END_VIDEO_SILENCE",
+    "SILENCE_PRE_MARGIN",
+    "SILENCE_POST_MARGIN",
+    "FADE_PRE_MARGIN",
+    "FADE_POST_MARGIN",
+]
+VIDEO_PARAMETERS = [
+    "EXTEND_LAST_FRAME",
+    "MAX_SPEEDX",
+    "CROSSFADEIN_DURATION",
+    "REMOVE_COLOUR_PALETTE",
+    "REMOVE_COLOUR_PALETTE_INTERVAL",
+    "RENDER_BACKEND",
+    "SMART_CUT",
+    "PROXY",
+    "PROXY_HEIGHT",
+    "PROXY_FPS",
+    "PROXY_WHITE_LEVEL",
+]
+PROXY_PARAMETERS = ["PROXY_HEIGHT", "PROXY_FPS", "SILENCE_SAMPLE_RATE"]
+
+
+def source_id(path):
+    """Identity of a source file (path, size and modification time)"""
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+
+def make_key(*parts):
+    """Hash of any JSON serializable data (plus the code version)"""
+    data = json.dumps([CODE_VERSION, parts], sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class RenderCache:
+    """Persistent content-addressed cache of the files produced by each stage, the
+    least recently used files are evicted when the cache is bigger than max_bytes"""
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+
+    def path(self, key, extension):
+        return os.path.join(self.folder, f"{key}.{extension}")
+
+    def fetch(self, key, destination):
+        """Copies the cached file to destination
+
+        Returns:
+            bool: True if the file was in the cache
+        """
+        cached_path = self.path(key, destination.rsplit(".", 1)[-1])
+        if not os.path.exists(cached_path):
+            self.misses += 1
+            return False
+
+        shutil.copyfile(cached_path, destination)
+        os.utime(cached_path)  # mark as recently used
+        self.hits += 1
+        return True
+
+    def store(self, key, source):
+        """Copies a produced file into the cache"""
+        cached_path = self.path(key, source.rsplit(".", 1)[-1])
+        temp_path = f"{cached_path}.{os.getpid()}.tmp"
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, cached_path)  # atomic, workers may store at once
+
+    def fetch_array(self, key):
+        """Loads a cached array
+
+        Returns:
+            np.array: cached array, None if it is not in the cache
+        """
+        cached_path = self.path(key, "npy")
+        if not os.path.exists(cached_path):
+            self.misses += 1
+            return None
+
+        array = np.load(cached_path)
+        os.utime(cached_path)  # mark as recently used
+        self.hits += 1
+        return array
+
+    def store_array(self, key, array):
+        """Saves an array into the cache"""
+        cached_path = self.path(key, "npy")
+        temp_path = f"{cached_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            np.save(file, array)
+        os.replace(temp_path, cached_path)  # atomic, workers may store at once
+
+    def evict(self):
+        """Removes the least recently used files until the cache fits in max_bytes
+
+        Returns:
+            int: number of bytes in the cache
+        """
+        files = []
+        for filename in os.listdir(self.folder):
+            file_path = os.path.join(self.folder, filename)
+            if os.path.isfile(file_path) and not filename.endswith(".tmp"):
+                stat = os.stat(file_path)
+                files.append((stat.st_mtime, stat.st_size, file_path))
+
+        total_bytes = sum(size for _, size, _ in files)
+        for _, size, file_path in sorted(files):
+            if total_bytes <= self.max_bytes:
+                break
+            os.remove(file_path)
+            total_bytes -= size
+
+        return total_bytes
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def print_report(stats, cache_bytes):
+    hits = sum(el["hits"] for el in stats)
+    misses = sum(el["misses"] for el in stats)
+    print("----------------------------- Cache -------------------------------")
+    print(f"Hits: {hits} - Misses: {misses} - Size: {cache_bytes / 1e9:.2f} GB")
+    print("-------------------------------------------------------------------")
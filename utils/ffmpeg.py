@@ -0,0 +1,683 @@
+import os
+import subprocess
+
+import numpy as np
+
+
+def run(command, debug=False, input_bytes=None):
+    """Runs an ffmpeg command and raises if it fails
+
+    Args:
+        command (list of strings): ffmpeg command
+        debug (bool, optional): print ffmpeg output to terminal. Defaults to False.
+        input_bytes (bytes, optional): data written to ffmpeg stdin. Defaults to None.
+    """
+    if debug:
+        buf = None  # print to terminal
+    else:
+        buf = subprocess.DEVNULL
+
+    process = subprocess.run(command, input=input_bytes, stdout=buf, stderr=buf)
+    if process.returncode != 0:
+        raise Exception(f"ffmpeg failed: {' '.join(command)}")
+
+
+def keyframe_times(source, t_start=None, t_end=None):
+    """Times of the video keyframes, read from the packet flags (nothing is decoded)
+
+    Args:
+        source (string): path of the video
+        t_start (float, optional): only read packets after this time. Defaults to None.
+        t_end (float, optional): only read packets before this time. Defaults to None.
+
+    Returns:
+        list of floats: keyframe times in seconds (sorted)
+    """
+    command = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "packet=pts_time,flags",
+        "-of",
+        "csv=print_section=0",
+    ]
+    if t_start is not None or t_end is not None:
+        interval = f"{'' if t_start is None else t_start}%"
+        interval += "" if t_end is None else f"{t_end}"
+        command += ["-read_intervals", interval]
+    command.append(f"{source}")
+    output = subprocess.run(command, capture_output=True, text=True, check=True)
+
+    keyframes = []
+    for line in output.stdout.splitlines():
+        pts_time, flags = (line.split(",") + [""])[:2]
+        if "K" in flags and pts_time not in ("", "N/A"):
+            keyframes.append(float(pts_time))
+    return sorted(keyframes)
+
+
+def media_duration(source, known_duration=0):
+    """Duration of a media file, also for files that are still being written
+    (without duration in the header the last video packet time is used)
+
+    Args:
+        source (string): path of the media file
+        known_duration (float, optional): duration found by a previous call, only
+                                          the packets after it are listed (files
+                                          being written). Defaults to 0.
+
+    Returns:
+        float: duration in seconds
+    """
+    command = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-show_entries",
+        "format=duration",
+        "-of",
+        "csv=print_section=0",
+        f"{source}",
+    ]
+    output = subprocess.run(command, capture_output=True, text=True, check=True)
+    try:
+        return float(output.stdout.strip())
+    except ValueError:  # N/A
+        pass
+
+    command = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-read_intervals",
+        f"{known_duration}%",
+        "-show_entries",
+        "packet=pts_time",
+        "-of",
+        "csv=print_section=0",
+        f"{source}",
+    ]
+    output = subprocess.run(command, capture_output=True, text=True, check=True)
+    times = [float(line) for line in output.stdout.split() if line not in ("", "N/A")]
+    return max(times, default=known_duration)
+
+
+def encoder_arguments(profile=None, threads=0):
+    """Encoder options of a render profile (see RENDER_PROFILES in video_editor.py)
+
+    Args:
+        profile (dict, optional): render profile, missing keys use the libx264
+                                  defaults. Defaults to None.
+        threads (int, optional): encoder threads, 0 is automatic. Defaults to 0.
+
+    Returns:
+        list of strings: ffmpeg output options
+    """
+    profile = profile or {}
+    arguments = ["-c:v", profile.get("codec", "libx264")]
+    if profile.get("preset"):
+        arguments += ["-preset", profile["preset"]]
+    if profile.get("crf") is not None:
+        arguments += ["-crf", f"{profile['crf']}"]
+    arguments += ["-pix_fmt", "yuv420p", "-c:a", "aac"]
+    if profile.get("audio_bitrate"):
+        arguments += ["-b:a", profile["audio_bitrate"]]
+    arguments += ["-threads", f"{threads}"]
+    return arguments
+
+
+def frame_rate(source):
+    """Frame rate of the first video stream of a file
+
+    Args:
+        source (string): path of the video
+
+    Returns:
+        float: frames per second
+    """
+    command = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "stream=r_frame_rate",
+        "-of",
+        "csv=print_section=0",
+        f"{source}",
+    ]
+    output = subprocess.run(command, capture_output=True, text=True, check=True)
+    numerator, denominator = (output.stdout.strip().split("/") + ["1"])[:2]
+    return float(numerator) / float(denominator)
+
+
+def video_filter(
+    trim,
+    fps,
+    cut_intervals=None,
+    extend_duration=0,
+    speedup=1.0,
+    output_fps=None,
+    height=None,
+):
+    """Builds the filter chain applied to the video of an event
+
+    Args:
+        trim (list): [start, end] of the event relative to the segment (seconds)
+        fps (float): frame rate of the segment
+        cut_intervals (list, optional): [start, stop] intervals (relative to the trimmed
+                                        video) to be removed. Defaults to None.
+        extend_duration (float, optional): seconds that the last frame is held. Defaults to 0.
+        speedup (float, optional): speed factor. Defaults to 1.0.
+        output_fps (float, optional): frame rate of the result, None keeps fps.
+                                      Defaults to None.
+        height (int, optional): height of the result, None keeps it. Defaults to None.
+
+    Returns:
+        string: filter chain (without input and output labels)
+    """
+    filters = [f"trim=start={trim[0]}:end={trim[1]}", "setpts=PTS-STARTPTS"]
+    if cut_intervals:
+        cut = "+".join(f"between(t,{start},{stop})" for start, stop in cut_intervals)
+        filters += [f"select='not({cut})'", f"setpts=N/({fps}*TB)"]
+    if extend_duration > 0:
+        filters.append(f"tpad=stop_mode=clone:stop_duration={extend_duration}")
+    if speedup != 1.0:
+        filters.append(f"setpts=PTS/{speedup}")
+    filters.append(f"fps={output_fps or fps}")
+    if height:
+        filters.append(f"scale=-2:{height}")
+    return ",".join(filters)
+
+
+def decimation_options(speedup, fps, output_fps=None, media=None):
+    """Decoder options that skip the frames a sped up video does not show: every
+    output frame is taken from a source frame step frames after the previous one, with
+    step >= keyframe interval only the keyframes are decoded and with step >= 2 the
+    non reference frames (B-frames) are not. Streams without B-frames (i.e. x264
+    ultrafast) have no non reference frames, below one keyframe per output frame
+    they are fully decoded (only the kept frames are converted). The output frames
+    move at most a few source frames (invisible at those speeds). Only valid for
+    chains that do not number the frames (see video_filter, cut_intervals)
+
+    Args:
+        speedup (float): speed factor
+        fps (float): frame rate of the source
+        output_fps (float, optional): frame rate of the result, None is fps. Defaults to None.
+        media (dict, optional): media index of the source (see utils.probe), None if
+                                unknown. Defaults to None.
+
+    Returns:
+        list of strings: ffmpeg input options (before -i)
+    """
+    media = media or {}
+    step = speedup * fps / (output_fps or fps)  # source frames per output frame
+    keyframe_interval = media.get("keyframe_interval")
+    if keyframe_interval and step >= keyframe_interval * fps:
+        return ["-skip_frame", "nokey"]
+    if step >= 2 and media.get("has_b_frames"):
+        return ["-skip_frame", "nonref"]
+    return []
+
+
+def read_frames(source, chain, width, height, t_start=0, input_options=None):
+    """Frames of a video after a filter chain, read one by one from an ffmpeg pipe
+    (only the frames that leave the chain are converted and sent to Python)
+
+    Args:
+        source (string): path of the video
+        chain (string): filter chain (see video_filter), its times start at t_start
+        width (int): width of the frames after the chain
+        height (int): height of the frames after the chain
+        t_start (float, optional): input seek (seconds). Defaults to 0.
+        input_options (list, optional): decoder options (see decimation_options).
+                                        Defaults to None.
+
+    Yields:
+        np.array: RGB frame (height x width x 3)
+    """
+    command = ["ffmpeg", "-v", "error"] + list(input_options or [])
+    command += ["-ss", f"{t_start}", "-i", f"{source}", "-vf", chain]
+    command += ["-f", "rawvideo", "-pix_fmt", "rgb24", "-"]
+    frame_bytes = width * height * 3
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    try:
+        while True:
+            data = process.stdout.read(frame_bytes)
+            if len(data) < frame_bytes:
+                break
+            yield np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+
+def crossfade_filters(
+    image_input, video_label, output_label, fps, duration, height=None
+):
+    """Filters that crossfade from the first frame of an input (still image) into a
+    video. xfade gives one frame less than the video, its last frame is cloned once so
+    the result keeps the duration of the video (and its audio)
+
+    Args:
+        image_input (int or string): index of the input with the image, or label of a
+                                     stream whose first frame is the image
+        video_label (string): label of the video (i.e. "[v]")
+        output_label (string): label of the result
+        fps (float): frame rate
+        duration (float): crossfade duration in seconds
+        height (int, optional): height of the video, None keeps the image height.
+                                Defaults to None.
+
+    Returns:
+        list of strings: filter chains
+    """
+    if isinstance(image_input, int):
+        image_input = f"[{image_input}:v]"
+    image_label = f"[img{output_label.strip('[]')}]"
+    scale = f"scale=-2:{height}," if height else ""
+    return [
+        f"{image_input}trim=end_frame=1,setpts=PTS-STARTPTS,{scale}"
+        f"tpad=stop_mode=clone:stop_duration={duration},fps={fps},"
+        f"format=yuv420p,settb=AVTB{image_label}",
+        f"{image_label}{video_label}xfade=transition=fade:duration={duration}:offset=0,"
+        f"tpad=stop_mode=clone:stop=1{output_label}",
+    ]
+
+
+def render_event(
+    source,
+    audio_samples,
+    sample_rate,
+    output_path,
+    trim,
+    fps,
+    cut_intervals=None,
+    extend_duration=0,
+    speedup=1.0,
+    crossfade_source=None,
+    crossfade_time=0,
+    crossfade_duration=0,
+    input_options=None,
+    threads=0,
+    profile=None,
+    debug=False,
+):
+    """Renders an event with a single ffmpeg call (trim, palette cut, last frame hold,
+    speedup, crossfade and audio replacement), frames never go through Python
+
+    Args:
+        source (string): path of the video segment
+        audio_samples (np.array): edited audio of the event (float32, n_frames x channels),
+                                  piped to ffmpeg
+        sample_rate (int): audio sample rate
+        output_path (string): path of the rendered event
+        trim (list): [start, end] of the event relative to the segment (seconds)
+        fps (float): frame rate of the segment
+        cut_intervals (list, optional): intervals removed from the trimmed video. Defaults to None.
+        extend_duration (float, optional): seconds that the last frame is held. Defaults to 0.
+        speedup (float, optional): speed factor. Defaults to 1.0.
+        crossfade_source (string, optional): video that contains the frame to crossfade
+                                             from, if None there is no crossfade. Defaults to None.
+        crossfade_time (float, optional): time of that frame in crossfade_source. Defaults to 0.
+        crossfade_duration (float, optional): crossfade duration in seconds. Defaults to 0.
+        input_options (list, optional): decoder options of the segment (see
+                                        decimation_options). Defaults to None.
+        threads (int, optional): encoder threads, 0 is automatic. Defaults to 0.
+        profile (dict, optional): render profile (frame rate, height and encoder
+                                  options). Defaults to None.
+    """
+    profile = profile or {}
+    command = ["ffmpeg", "-y"] + list(input_options or [])
+    command += [
+        "-i",
+        f"{source}",
+        "-f",
+        "f32le",
+        "-ar",
+        f"{sample_rate}",
+        "-ac",
+        f"{audio_samples.shape[1]}",
+        "-i",
+        "pipe:0",
+    ]
+    chain = video_filter(
+        trim,
+        fps,
+        cut_intervals,
+        extend_duration,
+        speedup,
+        profile.get("fps"),
+        profile.get("height"),
+    )
+    graph = [f"[0:v]{chain},format=yuv420p,settb=AVTB[v]"]
+    if crossfade_source is None:
+        video_label = "[v]"
+    else:
+        command += ["-ss", f"{crossfade_time}", "-i", f"{crossfade_source}"]
+        graph += crossfade_filters(
+            2,
+            "[v]",
+            "[vx]",
+            profile.get("fps") or fps,
+            crossfade_duration,
+            profile.get("height"),
+        )
+        video_label = "[vx]"
+
+    command += [
+        "-filter_complex",
+        ";".join(graph),
+        "-map",
+        video_label,
+        "-map",
+        "1:a",
+    ]
+    command += encoder_arguments(profile, threads)
+    command.append(f"{output_path}")
+
+    run(command, debug, audio_samples.astype("<f4").tobytes())
+
+
+def render_timeline(
+    source,
+    timeline,
+    audio_chunks,
+    sample_rate,
+    channels,
+    output_path,
+    fps,
+    crossfade_duration,
+    threads=0,
+    profile=None,
+    debug=False,
+):
+    """Renders the whole edited video with a single encoder pass, each event of the
+    timeline is read from the source (own seek), edited and concatenated inside the
+    filtergraph while the edited audio is streamed through the ffmpeg stdin. The
+    crossfade frame of an event is split from the input of the previous one when it
+    decodes every frame (one input per event)
+
+    Args:
+        source (string): path of the original video
+        timeline (list of dicts): one item per event with keys "start", "end" (source
+                                  times), "cut_intervals", "extend_duration", "speedup",
+                                  "input_options" (see decimation_options) and
+                                  "crossfade_time" (None if there is no crossfade)
+        audio_chunks (iterable): edited audio of each event (float32, n_frames x channels)
+        sample_rate (int): audio sample rate
+        channels (int): audio channels
+        output_path (string): path of the final video
+        fps (float): frame rate of the source
+        crossfade_duration (float): crossfade duration in seconds
+        threads (int, optional): encoder threads, 0 is automatic. Defaults to 0.
+        profile (dict, optional): render profile (frame rate, height and encoder
+                                  options). Defaults to None.
+    """
+    profile = profile or {}
+    command = ["ffmpeg", "-y"]
+    graph = []
+    labels = []
+    n_inputs = 0
+    image = None  # crossfade frame split from the previous input
+    for k, item in enumerate(timeline):
+        duration = item["end"] - item["start"]
+        command += item["input_options"]
+        command += ["-ss", f"{item['start']}", "-t", f"{duration}", "-i", f"{source}"]
+        video = f"[{n_inputs}:v]"
+        n_inputs += 1
+
+        # The next crossfade frame is in this input if no frame is skipped
+        following = timeline[k + 1] if k + 1 < len(timeline) else None
+        next_image = None
+        if (
+            following is not None
+            and following["crossfade_time"] is not None
+            and not item["input_options"]
+            and item["start"] <= following["crossfade_time"] < item["end"]
+        ):
+            graph.append(f"{video}split[s{k}][c{k}]")
+            # Half a frame earlier: the frame at crossfade_time despite rounding
+            image_start = following["crossfade_time"] - item["start"] - 0.5 / fps
+            graph.append(
+                f"[c{k}]trim=start={max(image_start, 0)},setpts=PTS-STARTPTS[i{k + 1}]"
+            )
+            video = f"[s{k}]"
+            next_image = f"[i{k + 1}]"
+
+        chain = video_filter(
+            [0, duration],
+            fps,
+            item["cut_intervals"],
+            item["extend_duration"],
+            item["speedup"],
+            profile.get("fps"),
+            profile.get("height"),
+        )
+        graph.append(f"{video}{chain},format=yuv420p,settb=AVTB[v{k}]")
+        labels.append(f"[v{k}]")
+
+        if item["crossfade_time"] is not None:
+            if image is None:
+                command += [
+                    "-ss",
+                    f"{item['crossfade_time']}",
+                    "-t",
+                    f"{2 / fps}",  # only the first frame is used
+                    "-i",
+                    f"{source}",
+                ]
+                image = n_inputs
+                n_inputs += 1
+            graph += crossfade_filters(
+                image,
+                labels[-1],
+                f"[x{k}]",
+                profile.get("fps") or fps,
+                crossfade_duration,
+                profile.get("height"),
+            )
+            labels[-1] = f"[x{k}]"
+        image = next_image
+
+    graph.append("".join(labels) + f"concat=n={len(labels)}:v=1:a=0[v]")
+    command += [
+        "-f",
+        "f32le",
+        "-ar",
+        f"{sample_rate}",
+        "-ac",
+        f"{channels}",
+        "-i",
+        "pipe:0",
+        "-filter_complex",
+        ";".join(graph),
+        "-map",
+        "[v]",
+        "-map",
+        f"{n_inputs}:a",
+    ]
+    command += encoder_arguments(profile, threads)
+    command.append(f"{output_path}")
+
+    if debug:
+        buf = None  # print to terminal
+    else:
+        buf = subprocess.DEVNULL
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=buf, stderr=buf)
+    try:
+        for chunk in audio_chunks:  # one event at a time, memory does not grow
+            process.stdin.write(chunk.astype("<f4").tobytes())
+    finally:
+        process.stdin.close()
+    if process.wait() != 0:
+        raise Exception(f"ffmpeg failed rendering {output_path}")
+
+
+# Bitstream of the recordings that can be smart cut: the edges are encoded with the
+# same profile and pixel format, the events are then joined by stream copy with the
+# ones fully encoded by libx264 (High profile, yuv420p)
+SMART_CUT_FORMAT = {"profile": "High", "pix_fmt": "yuv420p"}
+
+
+def smart_cut_points(keyframes, trim, head_duration=0):
+    """Keyframes that delimit the part of an event that can be stream copied: the
+    first one after the start (and after the crossfade) and the last one before the end
+
+    Args:
+        keyframes (list of floats): keyframe times of the segment (sorted)
+        trim (list): [start, end] of the event relative to the segment (seconds)
+        head_duration (float, optional): seconds after the start that are re-encoded
+                                         anyway (crossfade). Defaults to 0.
+
+    Returns:
+        tuple: (head end, tail start), None if there is no whole GOP to copy
+    """
+    head_end = next((t for t in keyframes if t >= trim[0] + head_duration), None)
+    tail_start = next((t for t in reversed(keyframes) if t <= trim[1]), None)
+    if head_end is None or tail_start is None or tail_start <= head_end:
+        return None
+    return head_end, tail_start
+
+
+def smart_cut_event(
+    source,
+    audio_samples,
+    sample_rate,
+    output_path,
+    trim,
+    fps,
+    cut_points,
+    parts_prefix=None,
+    crossfade_source=None,
+    crossfade_time=0,
+    crossfade_duration=0,
+    threads=0,
+    profile=None,
+    debug=False,
+):
+    """Renders an event that keeps its video (raw mode) re-encoding only the partial
+    GOPs at its edges (and the crossfade): the whole GOPs between the cut points are
+    stream copied and the edited audio is muxed with them, the cost depends on the
+    number of cut points instead of the event duration. The parts are joined as
+    MPEG-TS (parameter sets in every keyframe), the source must be H.264 with the
+    frame rate, resolution and bitstream format (SMART_CUT_FORMAT) of the output
+
+    Args:
+        source (string): path of the video segment
+        audio_samples (np.array): edited audio of the event (float32, n_frames x channels),
+                                  piped to ffmpeg
+        sample_rate (int): audio sample rate
+        output_path (string): path of the rendered event
+        trim (list): [start, end] of the event relative to the segment (seconds)
+        fps (float): frame rate of the segment
+        cut_points (tuple): (head end, tail start) keyframes, see smart_cut_points
+        parts_prefix (string, optional): path prefix of the parts, None is next to
+                                         the output. Defaults to None.
+        crossfade_source (string, optional): video that contains the frame to crossfade
+                                             from, if None there is no crossfade. Defaults to None.
+        crossfade_time (float, optional): time of that frame in crossfade_source. Defaults to 0.
+        crossfade_duration (float, optional): crossfade duration in seconds. Defaults to 0.
+        threads (int, optional): encoder threads, 0 is automatic. Defaults to 0.
+        profile (dict, optional): render profile (encoder options). Defaults to None.
+    """
+    profile = profile or {}
+    head_end, tail_start = cut_points
+    # Edges encoded in the profile of the copied GOPs
+    edge_arguments = ["-profile:v", SMART_CUT_FORMAT["profile"].lower()]
+    prefix = parts_prefix or os.path.splitext(output_path)[0]
+    parts = []
+
+    # Head: from the event start (plus crossfade) to the first copied keyframe
+    if head_end - trim[0] > 0.5 / fps:
+        parts.append(f"{prefix}_head.ts")
+        duration = head_end - trim[0]
+        command = ["ffmpeg", "-y", "-ss", f"{trim[0]}", "-i", f"{source}"]
+        graph = [
+            f"[0:v]{video_filter([0, duration], fps)},format=yuv420p,settb=AVTB[v]"
+        ]
+        video_label = "[v]"
+        if crossfade_source is not None:
+            command += ["-ss", f"{crossfade_time}", "-i", f"{crossfade_source}"]
+            graph += crossfade_filters(1, "[v]", "[vx]", fps, crossfade_duration)
+            video_label = "[vx]"
+        command += ["-filter_complex", ";".join(graph), "-map", video_label, "-an"]
+        command += encoder_arguments(profile, threads) + edge_arguments
+        command += ["-f", "mpegts", parts[-1]]
+        run(command, debug)
+
+    # Whole GOPs: stream copy (input seek lands on the keyframe itself). Timestamps
+    # are relative to the seek point, the keyframe is at -0.5 / fps and the frame at
+    # tail_start at duration - 0.5 / fps: the limit between the last copied frame and
+    # tail_start keeps that keyframe out (it is the first frame of the tail)
+    parts.append(f"{prefix}_copy.ts")
+    command = [
+        "ffmpeg",
+        "-y",
+        "-ss",
+        f"{head_end + 0.5 / fps}",
+        "-i",
+        f"{source}",
+        "-t",
+        f"{tail_start - head_end - 1.0 / fps}",
+        "-map",
+        "0:v",
+        "-c:v",
+        "copy",
+        "-bsf:v",
+        "h264_mp4toannexb",
+        "-f",
+        "mpegts",
+        parts[-1],
+    ]
+    run(command, debug)
+
+    # Tail: from the last keyframe to the event end (decoded from that keyframe)
+    if trim[1] - tail_start > 0.5 / fps:
+        parts.append(f"{prefix}_tail.ts")
+        duration = trim[1] - tail_start
+        command = ["ffmpeg", "-y", "-ss", f"{tail_start}", "-i", f"{source}"]
+        command += ["-vf", f"{video_filter([0, duration], fps)},format=yuv420p"]
+        command += ["-an"] + encoder_arguments(profile, threads) + edge_arguments
+        command += ["-f", "mpegts", parts[-1]]
+        run(command, debug)
+
+    # Video parts joined without re-encoding, only the edited audio is encoded
+    command = [
+        "ffmpeg",
+        "-y",
+        "-i",
+        f"concat:{'|'.join(parts)}",
+        "-f",
+        "f32le",
+        "-ar",
+        f"{sample_rate}",
+        "-ac",
+        f"{audio_samples.shape[1]}",
+        "-i",
+        "pipe:0",
+        "-map",
+        "0:v",
+        "-map",
+        "1:a",
+        "-c:v",
+        "copy",
+        "-c:a",
+        "aac",
+    ]
+    if profile.get("audio_bitrate"):
+        command += ["-b:a", profile["audio_bitrate"]]
+    command.append(f"{output_path}")
+    run(command, debug, audio_samples.astype("<f4").tobytes())
+
+    for part in parts:
+        os.remove(part)
@@ -0,0 +1,162 @@
+import contextlib
+import cProfile
+import glob
+import json
+import os
+import sys
+import threading
+import time
+
+import utils.utils
+
+try:
+    import resource
+except ImportError:  # i.e. Windows
+    resource = None
+
+# Configuration of this process (workers configure themselves from param)
+_config = {"trace_file": None, "temp_folder": None, "profile_stages": ()}
+
+
+def run_trace_file(trace_file):
+    """Trace file of this run: trace_file with the start time and process id, so
+    concurrent runs never share (or delete) each other's partial traces
+
+    Args:
+        trace_file (string): trace file set in param, None disables the trace
+
+    Returns:
+        string: trace file of this run (None if disabled)
+    """
+    if trace_file is None:
+        return None
+    root, extension = os.path.splitext(trace_file)
+    return f"{root}_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}{extension}"
+
+
+def configure(trace_file=None, profile_stages=(), temp_folder=None):
+    """Enables the instrumentation of this process
+
+    Args:
+        trace_file (string, optional): Chrome trace file of the run (see
+                                       run_trace_file), None disables the trace.
+                                       Defaults to None.
+        profile_stages (list of strings, optional): stages run under cProfile.
+                                                    Defaults to ().
+        temp_folder (string, optional): folder whose size change is recorded.
+                                        Defaults to None.
+    """
+    _config["trace_file"] = trace_file
+    _config["profile_stages"] = tuple(profile_stages or ())
+    _config["temp_folder"] = temp_folder
+
+
+def folder_bytes(folder):
+    if folder is None or not os.path.isdir(folder):
+        return 0
+    return sum(entry.stat().st_size for entry in os.scandir(folder) if entry.is_file())
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process, None if it can't be known"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return rss / 1024 / 1024  # bytes
+    return rss / 1024  # kilobytes
+
+
+def children_cpu_time():
+    """CPU time of the finished child processes (i.e. ffmpeg)"""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+@contextlib.contextmanager
+def stage(name, **args):
+    """Records wall time, CPU time, peak RSS and growth of the temp folder of a stage
+    into the trace file, and profiles it if it is in profile_stages. The temp folder
+    is shared by all the workers: its growth is the net size change of the whole
+    folder during the stage (files written minus deleted by every process), not the
+    output of the stage
+
+    Args:
+        name (string): stage name
+        **args: extra information stored in the trace (i.e. event index)
+    """
+    profiled = name in _config["profile_stages"]
+    if _config["trace_file"] is None and not profiled:
+        yield
+        return
+
+    if profiled:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start_bytes = folder_bytes(_config["temp_folder"])
+    start_cpu = time.process_time()
+    start_children = children_cpu_time()
+    start = time.time()
+    try:
+        yield
+    finally:
+        wall_time = time.time() - start
+        if profiled:
+            profiler.disable()
+            print(f"------------------------ Profile: {name} ------------------------")
+            utils.utils.print_profile(profiler)
+
+        if _config["trace_file"] is not None:
+            args.update(
+                {
+                    "cpu_time": time.process_time() - start_cpu,
+                    "children_cpu_time": children_cpu_time() - start_children,
+                    "peak_rss_mb": peak_rss_mb(),
+                    "temp_folder_growth": folder_bytes(_config["temp_folder"])
+                    - start_bytes,
+                }
+            )
+            event = {
+                "name": name,
+                "ph": "X",  # complete event
+                "ts": start * 1e6,  # microseconds
+                "dur": wall_time * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+            part = f"{_config['trace_file']}.{os.getpid()}.part"
+            with open(part, "a") as file:
+                file.write(json.dumps(event) + "\n")
+
+
+def merge_trace(trace_file):
+    """Joins the partial traces of all the processes into one Chrome trace file
+    (open it in chrome://tracing or https://ui.perfetto.dev) and prints a summary
+
+    Args:
+        trace_file (string): Chrome trace file
+    """
+    events = []
+    for part in glob.glob(f"{trace_file}.*.part"):
+        with open(part) as file:
+            events += [json.loads(line) for line in file if line.strip()]
+        os.remove(part)
+
+    with open(trace_file, "w") as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+    summary = {}
+    for event in events:
+        total = summary.setdefault(event["name"], [0, 0.0, 0.0])
+        total[0] += 1
+        total[1] += event["dur"] / 1e6
+        total[2] += event["args"]["cpu_time"] + event["args"]["children_cpu_time"]
+    print("---------------------------- Stages -------------------------------")
+    print(f"{'stage':25} {'calls':>6} {'wall (s)':>10} {'cpu (s)':>10}")
+    for name, (calls, wall_time, cpu_time) in summary.items():
+        print(f"{name:25} {calls:6} {wall_time:10.1f} {cpu_time:10.1f}")
+    print(f"Trace saved in {trace_file}")
+    print("-------------------------------------------------------------------")
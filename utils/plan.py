@@ -0,0 +1,79 @@
+import heapq
+import json
+
+import utils.timeline
+
+# Bump when the layout of the plan changes
+PLAN_VERSION = 3
+
+
+def estimate_wall_time(costs, n_workers):
+    """Makespan of the events when they are dispatched longest first to n_workers
+    (same order as utils.scheduler.run_events)
+
+    Args:
+        costs (list of floats): estimated seconds of each event
+        n_workers (int): number of workers
+
+    Returns:
+        float: estimated wall time in seconds
+    """
+    loads = [0.0] * max(min(n_workers, len(costs)), 1)
+    for cost in sorted(costs, reverse=True):
+        heapq.heapreplace(loads, loads[0] + cost)
+    return max(loads)
+
+
+def plan_events(plan):
+    """Events of a render plan (with their keyframe offset)"""
+    return [
+        utils.timeline.Event(
+            item["mode"], item["frames"], plan["fps"], item["offset_frames"]
+        )
+        for item in plan["events"]
+    ]
+
+
+def plan_path(video_path):
+    """Render plan of the last edit, saved next to the recording"""
+    return f"{video_path}.plan.json"
+
+
+def save_plan(plan, path):
+    """Writes a render plan as JSON (sorted keys, diffable between runs)"""
+    with open(path, "w") as file:
+        json.dump(plan, file, indent=2, sort_keys=True)
+
+
+def load_plan(path):
+    with open(path) as file:
+        plan = json.load(file)
+    if plan.get("version") != PLAN_VERSION:
+        raise Exception(f"Unsupported render plan version: {plan.get('version')}")
+    return plan
+
+
+def print_plan(plan):
+    print("------------------------------ Render plan ------------------------------")
+    print("  #  mode  source [s]  output [s]  gain [dB]  speedup")
+    for item in plan["events"]:
+        speedup = f"{item['speedup']:6.2f}"
+        if item["speedup"] > plan["parameters"]["MAX_SPEEDX"]:
+            speedup += " (capped at MAX_SPEEDX)"
+        if item["smart_cut"]:
+            speedup += " (smart cut)"
+        gain = "-" if item["gain_db"] is None else f"{item['gain_db']:+.1f}"
+        print(
+            f"{item['index']:3}  {item['mode']:4}  {item['video_seconds']:10.1f}"
+            f"  {item['output_seconds']:10.1f}  {gain:>9}  {speedup}"
+        )
+    totals = plan["totals"]
+    print("-------------------------------------------------------------------------")
+    print(f"Output duration:  {totals['output_seconds'] / 60:.1f} min")
+    print(f"Video to encode:  {totals['encode_seconds']:.1f} s")
+    print(f"Video to decode:  {totals['decode_seconds']:.1f} s")
+    print(
+        f"Estimated time:   {totals['wall_seconds'] / 60:.1f} min"
+        f" ({plan['n_workers']} workers, profile {plan['profile']})"
+    )
+    print("-------------------------------------------------------------------------")
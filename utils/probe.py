@@ -0,0 +1,124 @@
+import json
+import os
+import subprocess
+
+import numpy as np
+
+import utils.ffmpeg
+
+# Bump when the layout of the index changes
+INDEX_VERSION = 4
+
+
+def index_path(video_path):
+    """Media index cache, saved next to the recording"""
+    return f"{video_path}.probe.json"
+
+
+def probe_media(source):
+    """Metadata of a media file read by ffprobe from its headers and packet flags
+    (nothing is decoded)
+
+    Args:
+        source (string): path of the media file
+
+    Returns:
+        dict: "duration", "fps", "width", "height", "video_codec", "profile",
+              "pix_fmt", "has_b_frames" (reorder depth, 0 without B-frames),
+              "sample_rate", "channels", "streams" (index, type and codec of each
+              stream),
+              "keyframes" (times in seconds) and "keyframe_interval" (median)
+    """
+    command = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-show_entries",
+        "format=duration:stream=index,codec_type,codec_name,profile,pix_fmt,width,"
+        "height,has_b_frames,r_frame_rate,sample_rate,channels",
+        "-of",
+        "json",
+        f"{source}",
+    ]
+    output = subprocess.run(command, capture_output=True, text=True, check=True)
+    data = json.loads(output.stdout)
+
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+
+    keyframes = utils.ffmpeg.keyframe_times(source)
+    numerator, denominator = (video.get("r_frame_rate", "0/1").split("/") + ["1"])[:2]
+    try:
+        duration = float(data["format"]["duration"])
+    except (KeyError, ValueError):  # still being written
+        duration = utils.ffmpeg.media_duration(source)
+
+    return {
+        "duration": duration,
+        "fps": float(numerator) / float(denominator) if float(denominator) else None,
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "video_codec": video.get("codec_name"),
+        "profile": video.get("profile"),
+        "pix_fmt": video.get("pix_fmt"),
+        "has_b_frames": video.get("has_b_frames", 0),
+        "sample_rate": int(audio["sample_rate"]) if "sample_rate" in audio else None,
+        "channels": audio.get("channels"),
+        "streams": [
+            {key: stream.get(key) for key in ("index", "codec_type", "codec_name")}
+            for stream in streams
+        ],
+        "keyframes": keyframes,
+        "keyframe_interval": (
+            float(np.median(np.diff(keyframes))) if len(keyframes) > 1 else None
+        ),
+    }
+
+
+def media_index(video_path):
+    """Metadata of a recording (see probe_media), probed once and cached next to it
+    so every stage and run reads it without opening the recording
+
+    Args:
+        video_path (string): path of the recording
+
+    Returns:
+        dict: media index
+    """
+    stat = os.stat(video_path)
+    identity = [INDEX_VERSION, stat.st_size, stat.st_mtime_ns]
+    cache_path = index_path(video_path)
+    if os.path.exists(cache_path):
+        with open(cache_path) as file:
+            data = json.load(file)
+        if data.get("identity") == identity:
+            return data["index"]
+
+    index = probe_media(video_path)
+    try:
+        with open(cache_path, "w") as file:
+            json.dump({"identity": identity, "index": index}, file)
+    except OSError:
+        print(f"WARNING: Can't save the media index in {cache_path}")
+
+    return index
+
+
+def segment_index(index, start, end):
+    """Index of a segment extracted from the recording by stream copy (see
+    utils.video.extract_videos), times relative to the segment start
+
+    Args:
+        index (dict): media index of the recording
+        start (float): start of the segment (keyframe of the recording)
+        end (float): end of the segment
+
+    Returns:
+        dict: media index of the segment
+    """
+    segment = dict(index, duration=end - start)
+    segment["keyframes"] = [
+        t - start for t in index["keyframes"] if start - 1e-6 <= t < end
+    ]
+    return segment
@@ -0,0 +1,56 @@
+import os
+
+import utils.ffmpeg
+
+
+def proxy_path(temp_folder):
+    """Path of the proxy of the video being edited"""
+    return os.path.join(temp_folder, "proxy.mkv")
+
+
+def create_proxy(
+    source, destination, height=360, fps=10, sample_rate=8000, debug=False
+):
+    """Creates a low resolution proxy of a video for the analysis steps (silence and
+    colour palette detection), all its frames are keyframes (cheap seeks and decodes)
+    and its audio is a low rate mono track. The proxy keeps the timestamps of the
+    source, so any time found in it is valid for the full resolution render
+
+    Args:
+        source (string): path of the original video
+        destination (string): path of the proxy (MKV)
+        height (int, optional): proxy height in pixels. Defaults to 360.
+        fps (float, optional): proxy frame rate. Defaults to 10.
+        sample_rate (int, optional): proxy audio sample rate. Defaults to 8000.
+    """
+    command = [
+        "ffmpeg",
+        "-y",
+        "-i",
+        f"{source}",
+        "-vf",
+        f"fps={fps},scale=-2:{height}:flags=neighbor",  # probe pixels are not blurred
+        "-c:v",
+        "libx264",
+        "-preset",
+        "ultrafast",
+        "-tune",
+        "fastdecode",
+        "-g",
+        "1",  # intra frames only
+        "-crf",
+        "18",
+        "-c:a",
+        "pcm_s16le",
+        "-ac",
+        "1",
+        "-ar",
+        f"{sample_rate}",
+        f"{destination}",
+    ]
+    utils.ffmpeg.run(command, debug)
+
+
+def scale(source_height, param):
+    """Factor that maps pixel positions of the source into the proxy"""
+    return param["PROXY_HEIGHT"] / source_height
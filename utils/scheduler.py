@@ -0,0 +1,191 @@
+import concurrent.futures
+import functools
+import heapq
+import itertools
+import os
+import threading
+import time
+import traceback
+
+
+def total_memory_gb():
+    """Physical memory of the machine, None if it can't be known"""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1e9
+    except (AttributeError, ValueError, OSError):  # i.e. Windows
+        return None
+
+
+def max_workers(param):
+    """Number of events processed at once, limited by the CPU budget (each encoder
+    uses ENCODER_THREADS threads) and the memory budget (each worker holds its own
+    decoders and frames)
+
+    Args:
+        param (dict): parameters of the video editor
+
+    Returns:
+        int: maximum number of workers
+    """
+    if param["MAX_WORKERS"]:
+        return param["MAX_WORKERS"]
+
+    cpu_workers = max((os.cpu_count() or 1) // param["ENCODER_THREADS"], 1)
+
+    memory_gb = param["MEMORY_BUDGET_GB"] or total_memory_gb()
+    if memory_gb is None:
+        return cpu_workers
+    memory_workers = max(int(memory_gb // param["WORKER_MEMORY_GB"]), 1)
+
+    return min(cpu_workers, memory_workers)
+
+
+def timed_call(function, *args):
+    start = time.time()
+    result = function(*args)
+    return result, time.time() - start
+
+
+class SharedQueue:
+    """Queue of the events of several videos (batch mode) in front of one process
+    pool: at most n_workers events are submitted at once, and each free worker gets
+    the longest pending event of any video instead of the next one submitted
+
+    Args:
+        executor (ProcessPoolExecutor): process pool
+        n_workers (int): workers of the pool
+    """
+
+    def __init__(self, executor, n_workers):
+        self.executor = executor
+        self.n_workers = n_workers
+        self.pending = []  # heap of (-cost, order, function, args, future)
+        self.order = itertools.count()
+        self.running = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._dispatch, daemon=True)
+        self.thread.start()
+
+    def submit(self, cost, function, *args):
+        """Queues a call, same as executor.submit plus its estimated cost
+
+        Returns:
+            Future: result of the call
+        """
+        future = concurrent.futures.Future()
+        with self.condition:
+            heapq.heappush(
+                self.pending, (-cost, next(self.order), function, args, future)
+            )
+            self.condition.notify()
+        return future
+
+    def close(self):
+        """Stops dispatching (the pending calls are cancelled)"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+        for *_, future in self.pending:
+            future.cancel()
+
+    def _dispatch(self):
+        while True:
+            with self.condition:
+                while not self.closed and (
+                    not self.pending or self.running >= self.n_workers
+                ):
+                    self.condition.wait()
+                if self.closed:
+                    return
+                *_, function, args, future = heapq.heappop(self.pending)
+                self.running += 1
+            if not future.set_running_or_notify_cancel():
+                self._finished()
+                continue
+            try:
+                submitted = self.executor.submit(function, *args)
+            except Exception as e:  # i.e. broken pool
+                self._finished()
+                future.set_exception(e)
+                continue
+            submitted.add_done_callback(functools.partial(self._done, future))
+
+    def _done(self, future, submitted):
+        self._finished()
+        if submitted.exception() is not None:
+            future.set_exception(submitted.exception())
+        else:
+            future.set_result(submitted.result())
+
+    def _finished(self):
+        with self.condition:
+            self.running -= 1
+            self.condition.notify()
+
+
+def run_events(
+    function, arguments, costs, n_workers, executor=None, on_done=None, queue=None
+):
+    """Runs function for each event in a bounded process pool, longest events first
+    (shorter makespan), and raises if any of them fails
+
+    Args:
+        function (callable): function to be called, i.e. process_event
+        arguments (list of tuples): arguments of each call
+        costs (list of floats): estimated seconds of each event (see plan_render),
+                                used to order the calls
+        n_workers (int): maximum number of processes
+        executor (ProcessPoolExecutor, optional): pool of the events, None creates one.
+                                                  Defaults to None.
+        on_done (callable, optional): called with the index of each finished event
+                                      (i.e. to delete its inputs). Defaults to None.
+        queue (SharedQueue, optional): queue shared with other videos (batch mode),
+                                       replaces executor. Defaults to None.
+
+    Returns:
+        list: result of each call (same order as arguments)
+    """
+    if executor is None and queue is None:
+        with concurrent.futures.ProcessPoolExecutor(n_workers) as executor:
+            return run_events(function, arguments, costs, n_workers, executor, on_done)
+
+    order = sorted(range(len(arguments)), key=lambda k: -costs[k])
+    results = [None] * len(arguments)
+    wall_times = [None] * len(arguments)
+    errors = []
+
+    print(f"INFO: Processing {len(arguments)} events with {n_workers} workers")
+    if queue is not None:
+        futures = {
+            queue.submit(costs[k], timed_call, function, *arguments[k]): k
+            for k in order
+        }
+    else:
+        futures = {
+            executor.submit(timed_call, function, *arguments[k]): k for k in order
+        }
+    for future in concurrent.futures.as_completed(futures):
+        k = futures[future]
+        try:
+            results[k], wall_times[k] = future.result()
+            if on_done is not None:
+                on_done(k)
+        except Exception as e:
+            print(f"ERROR: Event {k} failed")
+            traceback.print_exception(type(e), e, e.__traceback__)
+            errors.append(k)
+
+    print("------------------------- Event wall time -------------------------")
+    for k in range(len(arguments)):
+        if wall_times[k] is None:
+            print(f"{k:3}: FAILED")
+        else:
+            print(f"{k:3}: {wall_times[k]:7.1f} s (planned {costs[k]:7.1f} s)")
+    print("-------------------------------------------------------------------")
+
+    if errors:
+        raise Exception(f"Failed events: {sorted(errors)}")
+
+    return results
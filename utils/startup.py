@@ -0,0 +1,11 @@
+"""Imported first by video_editor.py: wall clock of the process start, before the
+other imports, to report the startup time (imports) of each subcommand"""
+
+import time
+
+START = time.perf_counter()
+
+
+def elapsed():
+    """Wall time since this module was imported (seconds)"""
+    return time.perf_counter() - START
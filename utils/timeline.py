@@ -0,0 +1,135 @@
+import numpy as np
+
+# Sections of each event mode
+SECTIONS = {"edit": ("draw", "talk"), "raw": ("both",)}
+
+
+class Event:
+    """Immutable part of the edited video with its boundaries snapped to the frame
+    grid of the source video (stored as frame indices, so every stage gets exact frame
+    counts, and the audio is cut at the samples of those frames, see section_samples).
+    Sections are read in seconds like the dictionaries of log2times, i.e.
+    event["draw"] is (start, end), and event["offset"] is the distance from the start
+    of its video segment (keyframe) to the start of the event
+
+    Args:
+        mode (str): "edit" (draw and talk sections) or "raw" (both section)
+        frames (tuple of ints): start and end frame of each section
+        fps (float): frame rate of the source video
+        offset_frames (int, optional): offset in frames. Defaults to 0.
+    """
+
+    __slots__ = ("mode", "frames", "fps", "offset_frames")
+
+    def __init__(self, mode, frames, fps, offset_frames=0):
+        if mode not in SECTIONS:
+            raise Exception(f"Unkown event mode: {mode}")
+        if len(frames) != 2 * len(SECTIONS[mode]):
+            raise Exception(f"Wrong number of boundaries for a {mode} event: {frames}")
+        object.__setattr__(self, "mode", mode)
+        object.__setattr__(self, "frames", tuple(int(frame) for frame in frames))
+        object.__setattr__(self, "fps", float(fps))
+        object.__setattr__(self, "offset_frames", int(offset_frames))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Event is immutable")
+
+    def __reduce__(self):  # cheap pickling (workers)
+        return (Event, (self.mode, self.frames, self.fps, self.offset_frames))
+
+    def __repr__(self):  # also used by the cache keys
+        return f"Event({self.mode!r}, {self.frames}, {self.fps}, {self.offset_frames})"
+
+    def __eq__(self, other):
+        return isinstance(other, Event) and self.__reduce__() == other.__reduce__()
+
+    def __hash__(self):
+        return hash(self.__reduce__()[1])
+
+    @classmethod
+    def from_dict(cls, event, fps):
+        """Snaps an event of log2times / detect_silence to the frame grid"""
+        frames = []
+        for section in SECTIONS[event["mode"]]:
+            frames += [round(t * fps) for t in event[section]]
+        return cls(event["mode"], frames, fps, round(event.get("offset", 0) * fps))
+
+    def section_frames(self, section):
+        """(start, end) frame of a section"""
+        k = SECTIONS[self.mode].index(section)
+        return self.frames[2 * k], self.frames[2 * k + 1]
+
+    def n_frames(self, section):
+        start, end = self.section_frames(section)
+        return end - start
+
+    def __getitem__(self, key):
+        if key == "mode":
+            return self.mode
+        if key == "offset":
+            return self.offset_frames / self.fps
+        if key in SECTIONS[self.mode]:
+            start, end = self.section_frames(key)
+            return start / self.fps, end / self.fps
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in ("mode", "offset") or key in SECTIONS[self.mode]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def section_samples(self, section, sample_rate, origin_frame=0):
+        """(start, end) audio sample of a section relative to origin_frame, snapped to
+        the sample grid from the frame indices (no float seconds in between)"""
+        return tuple(
+            round((frame - origin_frame) * sample_rate / self.fps)
+            for frame in self.section_frames(section)
+        )
+
+    def segment_times(self):
+        """(start, end) of the source video used by the event in seconds"""
+        return self.frames[0] / self.fps, self.frames[-1] / self.fps
+
+    def with_offset(self, offset):
+        """Same event with a new offset (seconds, snapped to the frame grid)"""
+        return Event(self.mode, self.frames, self.fps, round(offset * self.fps))
+
+
+def snap_events(event_times, fps):
+    """Converts the events of log2times / detect_silence into immutable Events snapped
+    to the frame grid, empty sections are kept (zero frames)
+
+    Args:
+        event_times (list of dictionaries): events (times in seconds)
+        fps (float): frame rate of the source video
+
+    Returns:
+        list of Events: events snapped to the frame grid
+    """
+    return [Event.from_dict(event, fps) for event in event_times]
+
+
+def output_frames(n_samples, sample_rate, fps):
+    """Frames of an output whose duration is given by its audio (rounded up)"""
+    return int(np.ceil(n_samples * fps / sample_rate - 1e-9))
+
+
+def pad_to_frames(samples, sample_rate, fps):
+    """Pads audio with silence so its duration is a whole number of video frames
+
+    Args:
+        samples (np.array): audio samples (n_frames x channels)
+        sample_rate (int): audio sample rate
+        fps (float): video frame rate
+
+    Returns:
+        tuple: (padded samples, number of video frames)
+    """
+    n_frames = output_frames(len(samples), sample_rate, fps)
+    n_samples = round(n_frames * sample_rate / fps)
+    padding = np.zeros((max(n_samples - len(samples), 0), samples.shape[1]))
+    return np.concatenate([samples, padding.astype(samples.dtype)]), n_frames
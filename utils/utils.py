@@ -9,11 +9,12 @@ import pstats
 import cProfile
 
 # Parameters
-INPUT_EXTENSION = "mp4"
+INPUT_EXTENSIONS = ("mp4", "mkv")  # MKV: recordings edited in watch mode
 
 
 def profile(fnc):
-    """A decorator that uses cProfile to profile a function"""
+    """A decorator that uses cProfile to profile a function
+    (to profile pipeline stages use PROFILE_STAGES, see utils.instrument.stage)"""
 
     def inner(*args, **kwargs):
 
@@ -21,17 +22,29 @@ def profile(fnc):
         pr.enable()
         retval = fnc(*args, **kwargs)
         pr.disable()
-        s = io.StringIO()
-        sortby = "cumulative"
-        ps = pstats.Stats(pr, stream=s).sort_stats(sortby)
-        ps.print_stats()
-        print(s.getvalue())
+        print_profile(pr)
         return retval
 
     return inner
 
 
-def parse_arguments(param):
+def print_profile(pr, sortby="cumulative"):
+    s = io.StringIO()
+    ps = pstats.Stats(pr, stream=s).sort_stats(sortby)
+    ps.print_stats()
+    print(s.getvalue())
+
+
+def parse_arguments(param, subcommands=()):
+    """Arguments of an edit, or of a light subcommand (see parse_subcommand) if the
+    first one is in subcommands"""
+    if "pydevd" in sys.modules:
+        argv = param["DEBUGGER_ARGUMENTS"]
+    else:
+        argv = sys.argv[1:]
+    if argv and argv[0] in subcommands:
+        return parse_subcommand(argv, param)
+
     parser = argparse.ArgumentParser()
     parser.add_argument("video_file", help="Video file path")
     parser.add_argument(
@@ -40,14 +53,70 @@ def parse_arguments(param):
     parser.add_argument(
         "--move", action="store_true", help="Move files to the final folder"
     )
-    if "pydevd" in sys.modules:
-        args = parser.parse_args(param["DEBUGGER_ARGUMENTS"])
-    else:
-        args = parser.parse_args()
+    parser.add_argument(
+        "--profile",
+        default=param["RENDER_PROFILE"],
+        choices=list(param["RENDER_PROFILES"]),
+        help="Render profile (preview: fast low resolution review pass)",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Edit the events while OBS is recording (fragmented MP4 or MKV)",
+    )
+    args = parser.parse_args(argv)
+    args.command = "edit"
 
     return args
 
 
+def parse_subcommand(argv, param):
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    timestamps = subparsers.add_parser(
+        "timestamps", help="Print the events of the log file"
+    )
+    timestamps.add_argument("video_file", help="Video file path")
+
+    silence = subparsers.add_parser(
+        "silence", help="Print the events found by silence detection (cached envelope)"
+    )
+    silence.add_argument("video_file", help="Video file path")
+    silence.add_argument(
+        "--threshold",
+        type=float,
+        default=param["SILENCE_THRESHOLD_dB"],
+        help="Silence threshold in dBFS",
+    )
+    silence.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Thresholds from the loudness distribution of the recording",
+    )
+    silence.add_argument(
+        "--min-silence-ms",
+        type=int,
+        default=param["MIN_SILENCE_MS"],
+        help="Minimum length of a silence in milliseconds",
+    )
+
+    plan = subparsers.add_parser(
+        "plan", help="Print the render plan (durations, speedups, estimated time)"
+    )
+    plan.add_argument("video_file", help="Video file path")
+    plan.add_argument(
+        "--profile",
+        default=param["RENDER_PROFILE"],
+        choices=list(param["RENDER_PROFILES"]),
+        help="Render profile of the plan",
+    )
+    plan.add_argument("--output", help="Save the plan as JSON (i.e. plan.json)")
+
+    parser.set_defaults(output_file="final_video.mp4", move=False)
+    return parser.parse_args(argv)
+
+
 def process_arguments(args, display=True):
     # Folders
     obs_folder = "C:\\Users\\iuayala\\Videos\\OBS"
@@ -75,12 +144,12 @@ def process_arguments(args, display=True):
             f
             for f in os.listdir(obs_folder)
             if os.path.isfile(os.path.join(obs_folder, f))
-            and f.endswith("." + INPUT_EXTENSION)
+            and f.rsplit(".", 1)[-1] in INPUT_EXTENSIONS
             and f[0].isnumeric()
         ]
         video_files = sorted(video_files)
         if not video_files:
-            raise Exception(f"No file found with extension {INPUT_EXTENSION}")
+            raise Exception(f"No file found with extensions {INPUT_EXTENSIONS}")
         video_file = video_files[-1]
         abs_paths["raw"] = os.path.join(obs_folder, video_file)
     # Pass the whole name of the file to be processed
@@ -133,92 +202,116 @@ def log2times(log_file_path, video_duration):
         csv_reader = csv.reader(csv_file, delimiter=",")
         for row in csv_reader:
             time_string, event = row
-            date_time = datetime.datetime.strptime(time_string, "%H:%M:%S")
-            a_timedelta = date_time - datetime.datetime(1900, 1, 1)
-            time_seconds = a_timedelta.total_seconds()
-            if event == "Event Draw":
-                if state == "draw":  # Was draw now draw
-                    output[-1]["draw"][0] = time_seconds
-                elif state == "talk":  # Was talk now draw
-                    output[-1]["talk"][1] = time_seconds
-                    output.append(
-                        {"mode": "edit", "draw": [time_seconds, -1], "talk": [-1, -1]}
-                    )
-                elif state == "both":  # Was both now draw
-                    output[-1]["both"][1] = time_seconds
-                    output.append(
-                        {"mode": "edit", "draw": [time_seconds, -1], "talk": [-1, -1]}
-                    )
-                elif state == "stop":  # Was stop now draw
-                    output.append(
-                        {"mode": "edit", "draw": [time_seconds, -1], "talk": [-1, -1]}
-                    )
-                else:
-                    raise Exception(f"Unknown state found: {state}")
-                state = "draw"
-
-            elif event == "Event Talk":
-                if state == "draw":  # Was draw now talk
-                    output[-1]["draw"][1] = time_seconds
-                    output[-1]["talk"][0] = time_seconds
-                elif state == "talk":  # Was talk now talk
-                    output[-1]["talk"][0] = time_seconds
-                elif state == "both":  # Was both now talk
-                    output[-1]["both"][1] = time_seconds
-                    raise Exception(
-                        "Can't go directly from 'both' to 'talk', without 'draw' in between"
-                    )
-                elif state == "stop":  # Was stop now talk
-                    if output[-1]["mode"] == "edit":
-                        output[-1]["talk"][0] = time_seconds
-                    else:
-                        raise Exception("Can't use 'talk' without a previous 'draw'")
-                else:
-                    raise Exception(f"Unknown state found: {state}")
-                state = "talk"
-
-            elif event == "Event Both":
-                if state == "draw":  # Was draw now both
-                    output[-1]["draw"][1] = time_seconds
-                    raise Exception(
-                        "Can't go from 'draw' to 'both' without 'talk' in between"
-                    )
-                elif state == "talk":  # Was talk now both
-                    output[-1]["talk"][1] = time_seconds
-                    output.append({"mode": "raw", "both": [time_seconds, -1]})
-                elif state == "both":  # Was both now both
-                    output[-1]["both"][0] = time_seconds
-                elif state == "stop":  # Was stop now both
-                    output.append({"mode": "raw", "both": [time_seconds, -1]})
-                else:
-                    raise Exception(f"Unknown state found: {state}")
-                state = "both"
-
-            elif event == "Event Stop":
-                if state == "draw":  # Was draw now stop
-                    output[-1]["draw"][1] = time_seconds
-                elif state == "talk":  # Was talk now stop
-                    output[-1]["talk"][1] = time_seconds
-                elif state == "both":  # Was both now stop
-                    output[-1]["both"][1] = time_seconds
-                elif state == "stop":  # Was stop now stop
-                    pass
-                else:
-                    raise Exception(f"Unknown state found: {state}")
-                state = "stop"
+            state = log_step(output, state, log_time2seconds(time_string), event)
+
+    close_log(output, state, video_duration)
 
+    return output
+
+
+def log_time2seconds(time_string):
+    date_time = datetime.datetime.strptime(time_string, "%H:%M:%S")
+    a_timedelta = date_time - datetime.datetime(1900, 1, 1)
+    return a_timedelta.total_seconds()
+
+
+def log_step(output, state, time_seconds, event):
+    """Applies one log event to the list of parts (see log2times), all the parts but
+    the last one are final
+
+    Args:
+        output (list of dictionaries): parts of the video so far (modified)
+        state (str): current state (draw, talk, both, stop)
+        time_seconds (float): time of the event in seconds
+        event (str): log event (i.e. "Event Draw")
+
+    Returns:
+        str: new state
+    """
+    if event == "Event Draw":
+        if state == "draw":  # Was draw now draw
+            output[-1]["draw"][0] = time_seconds
+        elif state == "talk":  # Was talk now draw
+            output[-1]["talk"][1] = time_seconds
+            output.append(
+                {"mode": "edit", "draw": [time_seconds, -1], "talk": [-1, -1]}
+            )
+        elif state == "both":  # Was both now draw
+            output[-1]["both"][1] = time_seconds
+            output.append(
+                {"mode": "edit", "draw": [time_seconds, -1], "talk": [-1, -1]}
+            )
+        elif state == "stop":  # Was stop now draw
+            output.append(
+                {"mode": "edit", "draw": [time_seconds, -1], "talk": [-1, -1]}
+            )
+        else:
+            raise Exception(f"Unknown state found: {state}")
+        state = "draw"
+
+    elif event == "Event Talk":
+        if state == "draw":  # Was draw now talk
+            output[-1]["draw"][1] = time_seconds
+            output[-1]["talk"][0] = time_seconds
+        elif state == "talk":  # Was talk now talk
+            output[-1]["talk"][0] = time_seconds
+        elif state == "both":  # Was both now talk
+            output[-1]["both"][1] = time_seconds
+            raise Exception(
+                "Can't go directly from 'both' to 'talk', without 'draw' in between"
+            )
+        elif state == "stop":  # Was stop now talk
+            if output[-1]["mode"] == "edit":
+                output[-1]["talk"][0] = time_seconds
             else:
-                print(f"WARNING: Unkown event: {event}")
-
-        # Close last state
-        if state == "draw":  # Was draw
-            output[-1]["draw"][1] = video_duration
-        elif state == "talk":  # Was talk
-            output[-1]["talk"][1] = video_duration
-        elif state == "stop":  # Was stop
+                raise Exception("Can't use 'talk' without a previous 'draw'")
+        else:
+            raise Exception(f"Unknown state found: {state}")
+        state = "talk"
+
+    elif event == "Event Both":
+        if state == "draw":  # Was draw now both
+            output[-1]["draw"][1] = time_seconds
+            raise Exception("Can't go from 'draw' to 'both' without 'talk' in between")
+        elif state == "talk":  # Was talk now both
+            output[-1]["talk"][1] = time_seconds
+            output.append({"mode": "raw", "both": [time_seconds, -1]})
+        elif state == "both":  # Was both now both
+            output[-1]["both"][0] = time_seconds
+        elif state == "stop":  # Was stop now both
+            output.append({"mode": "raw", "both": [time_seconds, -1]})
+        else:
+            raise Exception(f"Unknown state found: {state}")
+        state = "both"
+
+    elif event == "Event Stop":
+        if state == "draw":  # Was draw now stop
+            output[-1]["draw"][1] = time_seconds
+        elif state == "talk":  # Was talk now stop
+            output[-1]["talk"][1] = time_seconds
+        elif state == "both":  # Was both now stop
+            output[-1]["both"][1] = time_seconds
+        elif state == "stop":  # Was stop now stop
             pass
+        else:
+            raise Exception(f"Unknown state found: {state}")
+        state = "stop"
 
-    return output
+    else:
+        print(f"WARNING: Unkown event: {event}")
+
+    return state
+
+
+def close_log(output, state, video_duration):
+    """Closes the last part when the video ends (see log2times)"""
+    # Close last state
+    if state == "draw":  # Was draw
+        output[-1]["draw"][1] = video_duration
+    elif state == "talk":  # Was talk
+        output[-1]["talk"][1] = video_duration
+    elif state == "stop":  # Was stop
+        pass
 
 
 def print_timestamps(event_times, width=6, precision=1):
@@ -258,15 +351,20 @@ def file_starts_with(folder, file_starts):
     return None
 
 
-def export_last_visual_frame(video, event, image_path):
+def last_visual_frame_time(event):
     # Time of event is referenced to the whole video
-    # But "video" is a subclip with only this section
+    # But the video segment is a subclip with only this section
+    # (starting "offset" seconds before the event)
+    offset = event.get("offset", 0)
     if event["mode"] == "raw":
-        last_visual_frame_time = event["both"][1] - event["both"][0]
+        return offset + event["both"][1] - event["both"][0]
     elif event["mode"] == "edit":
-        last_visual_frame_time = event["draw"][1] - event["draw"][0]
+        return offset + event["draw"][1] - event["draw"][0]
+    raise Exception(f"Unkown event mode: {event['mode']}")
+
 
-    video.save_frame(image_path, last_visual_frame_time)
+def export_last_visual_frame(video, event, image_path):
+    video.save_frame(image_path, last_visual_frame_time(event))
 
 
 if __name__ == "__main__":
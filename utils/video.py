@@ -1,7 +1,11 @@
-import moviepy.editor as mpe
-from moviepy.video.compositing.concatenate import concatenate_videoclips
 import subprocess
 import os.path
+import bisect
+import concurrent.futures
+
+import numpy as np
+
+import utils.ffmpeg
 
 # Down an right from top left
 # Acquired by looking in Gimp with a frame that had the colour palette
@@ -28,57 +32,239 @@ def remove_colur_palette(video, search_interval=1.0):
     Returns:
         VideoClip: Video without colour palette
     """
+    palette_intervals = colour_palette_intervals(video, search_interval)
+
+    return cut_intervals(video, palette_intervals)
+
+
+def cut_intervals(video, intervals):
+    """Removes some intervals of a VideoClip with a single concatenation
+
+    Args:
+        video (VideoClip): Video to be modified
+        intervals (list): [start, stop] of each interval to be removed (sorted)
+
+    Returns:
+        VideoClip: Video without the intervals
+    """
+    from moviepy.video.compositing.concatenate import concatenate_videoclips
+
+    if not intervals:
+        return video
+
+    keep = []
     current_time = 0
-    palette_intervals = []
-    previous_active = False
-    while current_time < video.duration:
-        np_frame = video.get_frame(current_time)  # time in seconds
-        active = active_colour_palette(np_frame)
-        if not previous_active and active:  # color palette opened
-            palette_intervals.append([max(current_time - search_interval, 0), -1])
-        if previous_active and not active:  # color palette closed
-            palette_intervals[-1][1] = min(
-                current_time + search_interval, video.duration
-            )
+    for start, stop in intervals:
+        if start > current_time:
+            keep.append(video.subclip(current_time, start))
+        current_time = max(current_time, stop)
+    if current_time < video.duration:
+        keep.append(video.subclip(current_time, video.duration))
 
-        previous_active = active
-        current_time += search_interval
+    return concatenate_videoclips(keep)
 
-    if previous_active:
-        palette_intervals[-1][1] = video.duration
 
-    for start, stop in reversed(palette_intervals):
-        video = video.cutout(start, stop)
+def colour_palette_intervals(video, search_interval=1.0):
+    """Finds the intervals of a VideoClip where the colour palette is open
 
-    return video
+    Args:
+        video (VideoClip): Video to be searched
+        search_interval (float, optional): Interval at which the colour plaette will
+                                           be searched for. Defaults to 1.0.
+
+    Returns:
+        list: [start, stop] of each interval with colour palette (seconds)
+    """
+    n_samples = int(np.ceil(video.duration / search_interval))
+    active = [
+        active_colour_palette(video.get_frame(k * search_interval))  # time in seconds
+        for k in range(n_samples)
+    ]
+
+    return palette_flags2intervals(np.array(active), search_interval, video.duration)
 
 
-def extend_last_frame(video, extend_value):
-    """Extends the last frame of the video by a certain amount
+def colour_palette_intervals_stream(
+    source, t_start, t_end, search_interval=1.0, scale=1.0, white_level=255
+):
+    """Same as colour_palette_intervals but the probe pixels of all the searched
+    frames are read at once from a single sequential ffmpeg stream (only the
+    PALETTE_INDEXES pixels are sent through the pipe), and checked in NumPy
 
     Args:
-        video (VideoClip): Video to be extended
-        extend_value (float):
-            If this value is 1.0 then the same video is returned
-            If this value is smaller than one, this is the % of extension of the video duration
-            If this value is greater than 1.0, then this is the duration of the extension in seconds
+        source (string): path of the video
+        t_start (float): start of the searched interval in the video (seconds)
+        t_end (float): end of the searched interval in the video (seconds)
+        search_interval (float, optional): Interval at which the colour plaette will
+                                           be searched for. Defaults to 1.0.
+        scale (float, optional): size of the video relative to the original recording,
+                                 i.e. for proxies (see utils.proxy). Defaults to 1.0.
+        white_level (int, optional): minimum value of a white probe pixel (lower for
+                                     lossy proxies). Defaults to 255.
 
     Returns:
-        VideoClip: Extended VideoClip
+        list: [start, stop] of each interval with colour palette (seconds, relative
+              to t_start)
     """
-    if extend_value == 1.0:
-        return video
+    # One 1x1 crop per probe pixel, stacked in a single row
+    n_pixels = len(PALETTE_INDEXES)
+    graph = [
+        f"[0:v]fps=1/{search_interval}:round=down,split={n_pixels}"
+        + "".join(f"[s{k}]" for k in range(n_pixels))
+    ]
+    for k, (down, right) in enumerate(PALETTE_INDEXES):
+        graph.append(f"[s{k}]crop=1:1:{int(right * scale)}:{int(down * scale)}[p{k}]")
+    graph.append(
+        "".join(f"[p{k}]" for k in range(n_pixels)) + f"hstack=inputs={n_pixels}[v]"
+    )
+    command = [
+        "ffmpeg",
+        "-ss",
+        f"{t_start}",
+        "-i",
+        f"{source}",
+        "-t",
+        f"{t_end - t_start}",
+        "-filter_complex",
+        ";".join(graph),
+        "-map",
+        "[v]",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "rgb24",
+        "-",
+    ]
+    output = subprocess.run(
+        command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True
+    )
 
-    last_frame = video.get_frame(video.duration - 0.1)
-    if extend_value > 1.0:
-        extension_duration = extend_value
-    else:
-        extension_duration = video.duration * extend_value
+    pixels = np.frombuffer(output.stdout, dtype=np.uint8).reshape(-1, n_pixels, 3)
+    white = np.all(pixels >= white_level, axis=2)
+    active = ~np.any(white, axis=1)
+
+    return palette_flags2intervals(active, search_interval, t_end - t_start)
+
+
+def palette_flags2intervals(active, search_interval, duration):
+    """Converts the colour palette state of each searched frame into intervals, each
+    interval is widened by one search interval on both sides (and merged if they overlap)
+
+    Args:
+        active (np.array): True if the palette is open at k * search_interval
+        search_interval (float): Interval at which the colour plaette was searched for
+        duration (float): duration of the searched video
+
+    Returns:
+        list: [start, stop] of each interval with colour palette (seconds)
+    """
+    flags = np.concatenate(([False], active, [False])).astype(np.int8)
+    changes = np.diff(flags)
+    opened = np.flatnonzero(changes == 1)  # first active sample
+    closed = np.flatnonzero(changes == -1)  # first inactive sample
+
+    starts = np.maximum((opened - 1) * search_interval, 0)
+    stops = np.minimum((closed + 1) * search_interval, duration)
+    stops[closed == len(active)] = duration  # still open at the end
+
+    # Widened intervals may overlap
+    intervals = []
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        if intervals and start <= intervals[-1][1]:
+            intervals[-1][1] = max(intervals[-1][1], stop)
+        else:
+            intervals.append([start, stop])
+    return intervals
+
+
+def decimated_clip(
+    source,
+    trim,
+    fps,
+    n_frames,
+    size,
+    cut_intervals=None,
+    extend_duration=0,
+    speedup=1.0,
+    output_fps=None,
+    input_options=None,
+):
+    """Same as subclip + cut_intervals + last frame extension + speedx of a VideoFileClip
+    but only the frames of the result are read: the output frame times are fixed by
+    the ffmpeg chain (see utils.ffmpeg.video_filter) and the frames are read in order
+    from its pipe (restarted if a frame before the last one is requested)
 
-    extension_video = mpe.ImageClip(last_frame, duration=extension_duration)
-    extended_video = concatenate_videoclips([video, extension_video])
+    Args:
+        source (string): path of the video segment
+        trim (list): [start, end] of the section relative to the segment (seconds)
+        fps (float): frame rate of the segment
+        n_frames (int): frames of the result (the last one is held if ffmpeg gives fewer)
+        size (tuple): (width, height) of the segment
+        cut_intervals (list, optional): intervals removed from the trimmed video. Defaults to None.
+        extend_duration (float, optional): seconds that the last frame is held. Defaults to 0.
+        speedup (float, optional): speed factor. Defaults to 1.0.
+        output_fps (float, optional): frame rate of the result, None is fps. Defaults to None.
+        input_options (list, optional): decoder options (see
+                                        utils.ffmpeg.decimation_options). Defaults to None.
 
-    return extended_video
+    Returns:
+        VideoClip: sped up section
+    """
+    from moviepy.video.VideoClip import VideoClip
+
+    output_fps = output_fps or fps
+    chain = utils.ffmpeg.video_filter(
+        [0, trim[1] - trim[0]],
+        fps,
+        cut_intervals,
+        extend_duration,
+        speedup,
+        output_fps,
+    )
+    state = {"frames": None, "index": -1, "frame": None}
+
+    def make_frame(t):
+        k = min(int(round(t * output_fps)), n_frames - 1)
+        if state["frames"] is None or k < state["index"]:
+            state["frames"] = utils.ffmpeg.read_frames(
+                source, chain, size[0], size[1], trim[0], input_options
+            )
+            state["index"] = -1
+        while state["index"] < k:
+            frame = next(state["frames"], None)
+            if frame is None:  # held
+                if state["frame"] is None:
+                    raise Exception(
+                        f"ffmpeg gave no frames of {source} between {trim[0]} s "
+                        f"and {trim[1]} s"
+                    )
+                break
+            state["frame"] = frame
+            state["index"] += 1
+        return state["frame"]
+
+    clip = VideoClip(make_frame, duration=n_frames / output_fps)
+    clip.fps = output_fps
+    return clip
+
+
+def extension_duration(video_duration, extend_value):
+    """Duration of the last frame extension (see EXTEND_LAST_FRAME)
+
+    Args:
+        video_duration (float): duration of the video to be extended
+        extend_value (float): if 1.0 there is no extension, if smaller than one it is
+                              the % of the video duration, if greater than 1.0 it is
+                              the duration of the extension in seconds
+
+    Returns:
+        float: extension duration in seconds
+    """
+    if extend_value == 1.0:
+        return 0
+    if extend_value > 1.0:
+        return extend_value
+    return video_duration * extend_value
 
 
 def extract_video(source, destination, t_beg, t_end, debug=False):
@@ -97,7 +283,7 @@ def extract_video(source, destination, t_beg, t_end, debug=False):
         "-ss",
         f"{t_beg}",  # start time
         "-t",
-        f"{t_end}",  # end time
+        f"{t_end - t_beg}",  # duration
         "-i",
         f"{source}",  # source video file path
         "-acodec",  # audio codec
@@ -107,12 +293,67 @@ def extract_video(source, destination, t_beg, t_end, debug=False):
         f"{destination}",  # output video file path
     ]
 
-    if debug:
-        buf = None  # print to terminal
-    else:
-        buf = subprocess.DEVNULL
+    utils.ffmpeg.run(command, debug)
+
+
+def keyframe_starts(keyframes, segments):
+    """Start of each segment moved to the keyframe at or before its beginning
+
+    Args:
+        keyframes (list of floats): keyframe times of the source (sorted)
+        segments (list): [t_beg, t_end] of each segment
+
+    Returns:
+        list of floats: start time of each segment
+    """
+    starts = []
+    for t_beg, _ in segments:
+        k = bisect.bisect_right(keyframes, t_beg + 1e-6) - 1
+        starts.append(keyframes[k] if k >= 0 else 0.0)
+    return starts
 
-    subprocess.call(command, shell=True, stdout=buf, stderr=buf)
+
+def extract_videos(source, starts, ends, destinations, fps, n_workers=4, debug=False):
+    """Extracts several video segments at once (stream copy, one ffmpeg per segment),
+    each start must be a keyframe (see keyframe_starts) so the segment begins
+    exactly there and its position in the source is known without probing it
+
+    Args:
+        source (string): path of the video source
+        starts (list of floats): start time of each segment (keyframes)
+        ends (list of floats): end time of each segment
+        destinations (list of strings): path of each segment (including extension)
+        fps (float): frame rate of the source
+        n_workers (int, optional): ffmpeg processes running at once. Defaults to 4.
+    """
+
+    def extract(start, end, destination):
+        command = [
+            "ffmpeg",
+            "-y",  # overwrite
+            "-ss",
+            # Half a frame after the keyframe (its probed time is rounded and may be
+            # just before its pts), the stream copy starts at that keyframe
+            f"{start + 0.5 / fps}",
+            "-i",
+            f"{source}",
+            "-t",
+            f"{end - start}",  # duration
+            "-c",
+            "copy",
+            "-avoid_negative_ts",
+            "make_zero",
+            f"{destination}",
+        ]
+        utils.ffmpeg.run(command, debug)
+
+    with concurrent.futures.ThreadPoolExecutor(n_workers) as executor:
+        futures = [
+            executor.submit(extract, start, end, destination)
+            for start, end, destination in zip(starts, ends, destinations)
+        ]
+        for future in futures:
+            future.result()  # raise errors
 
 
 def concatenate_videos(video_list, output, debug=False):
@@ -122,8 +363,7 @@ def concatenate_videos(video_list, output, debug=False):
         video_list (list of strings): list of paths to each video to be concatenated
         output (string): path to the output video
     """
-    last_backslash = video_list[0].rfind("\\")
-    temp_folder = video_list[0][:last_backslash]
+    temp_folder = os.path.dirname(video_list[0])
 
     # Create text file
     video_list_path = os.path.join(temp_folder, "vidlist.txt")
@@ -146,12 +386,7 @@ def concatenate_videos(video_list, output, debug=False):
         f"{output}",
     ]
 
-    if debug:
-        buf = None  # print to terminal
-    else:
-        buf = subprocess.DEVNULL
-
-    subprocess.call(command, shell=True, stdout=buf, stderr=buf)
+    utils.ffmpeg.run(command, debug)
 
 
 if __name__ == "__main__":
@@ -171,10 +406,6 @@ if __name__ == "__main__":
     video_file = os.path.join(obs_folder, "1S4V1 - Why Learn Control Theory (Raw).mp4")
     video = VideoFileClip(video_file)
 
-    # extend_last_frame test
-    video = extend_last_frame(video, 0.1)
-    video.write_videofile(os.path.join(obs_folder, "test.mp4"))
-
     # remove_colour_palette test
     remove_colur_palette(video)
     """
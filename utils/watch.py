@@ -0,0 +1,254 @@
+import concurrent.futures
+import csv
+import os
+import subprocess
+import time
+import traceback
+
+import utils.utils
+import utils.ffmpeg
+import utils.video
+import utils.scheduler
+import utils.timeline
+
+# Keyframes are searched this long before the start of a segment (seconds)
+KEYFRAME_LOOKBACK = 60
+
+
+def read_log_lines(log_path, position):
+    """Reads the complete lines added to the log since position (a line that is
+    still being written is left for the next call)
+
+    Args:
+        log_path (string): path of the log file
+        position (int): bytes of the log already read
+
+    Returns:
+        tuple: (list of rows [time_string, event], new position)
+    """
+    if not os.path.exists(log_path):
+        return [], position
+
+    with open(log_path, "rb") as file:
+        file.seek(position)
+        data = file.read()
+
+    end = data.rfind(b"\n") + 1
+    lines = data[:end].decode().splitlines()
+    rows = [row for row in csv.reader(lines, delimiter=",") if row]
+    return rows, position + end
+
+
+def segment(event):
+    """[t_beg, t_end] of the original video used by an event"""
+    if event["mode"] == "raw":
+        return [event["both"][0], event["both"][1]]
+    elif event["mode"] == "edit":
+        return [event["draw"][0], event["talk"][1]]
+    raise Exception(f"Unkown event mode: {event['mode']}")
+
+
+def extract_segment(video_path, event, destination):
+    """Extracts the video segment of an event from the recording, the segment starts
+    at the previous keyframe
+
+    Returns:
+        Event: the event with its offset from the segment start
+    """
+    t_beg, t_end = event.segment_times()
+    keyframes = utils.ffmpeg.keyframe_times(
+        video_path, max(t_beg - KEYFRAME_LOOKBACK, 0), t_beg + 1
+    )
+    start = utils.video.keyframe_starts(keyframes, [[t_beg, t_end]])[0]
+    utils.video.extract_videos(
+        video_path, [start], [t_end], [destination], event.fps, 1
+    )
+    return event.with_offset(t_beg - start)
+
+
+def watch_recording(video_path, log_path, temp_folder, param, process_event):
+    """Edits a recording while it is still being written: the OBS log is tailed and
+    each event is processed as soon as its boundaries are closed and the recording
+    covers it, when the recording stops only the last event is left
+
+    Args:
+        video_path (string): recording being written (fragmented MP4 or MKV)
+        log_path (string): OBS log file being written
+        temp_folder (string): folder of the video segments and outputs
+        param (dict): parameters of the video editor
+        process_event (callable): function that edits an event (see video_editor.py)
+
+    Returns:
+        list of Events: events of the recording (see utils.timeline)
+    """
+    output = []
+    events = []  # dispatched events, snapped to the frame grid
+    state = "stop"  # draw, talk, both, stop
+    position = 0
+    dispatched = 0
+    futures = {}
+    recorded = 0.0  # seconds of the recording available
+    size = -1
+    idle_since = time.time()
+    fps = None
+
+    n_workers = utils.scheduler.max_workers(param)
+    print(f"INFO: Watching {video_path} and {log_path} with {n_workers} workers")
+    with concurrent.futures.ProcessPoolExecutor(n_workers) as executor:
+
+        def dispatch(i, n_events):
+            destination = os.path.join(temp_folder, f"video_segment_{i}.mp4")
+            event = utils.timeline.Event.from_dict(output[i], fps)
+            events.append(extract_segment(video_path, event, destination))
+            previous_event = events[i - 1] if i > 0 else None
+            future = executor.submit(
+                process_event,
+                i,
+                n_events,
+                events[i],
+                temp_folder,
+                param,
+                previous_event,
+            )
+            futures[future] = i
+            print(f"INFO: Event {i} dispatched ({segment(output[i])[1]:.1f} s)")
+
+        while True:
+            rows, position = read_log_lines(log_path, position)
+            for time_string, event in rows:
+                time_seconds = utils.utils.log_time2seconds(time_string)
+                state = utils.utils.log_step(output, state, time_seconds, event)
+
+            # The recording is finished when its size stops changing
+            if os.path.exists(video_path) and os.path.getsize(video_path) != size:
+                size = os.path.getsize(video_path)
+                idle_since = time.time()
+            if size > 0 and time.time() - idle_since > param["WATCH_IDLE_SECONDS"]:
+                break
+
+            # Every event but the last one is closed (the log may still modify it)
+            if dispatched < len(output) - 1 and size > 0:
+                if fps is None:
+                    fps = utils.ffmpeg.frame_rate(video_path)
+                if segment(output[dispatched])[1] > recorded:
+                    recorded = utils.ffmpeg.media_duration(video_path, recorded)
+                while (
+                    dispatched < len(output) - 1
+                    and segment(output[dispatched])[1] <= recorded
+                ):
+                    dispatch(dispatched, None)  # not the last event
+                    dispatched += 1
+
+            time.sleep(param["WATCH_POLL_SECONDS"])
+
+        # Recording stopped: close the log and process the remaining events
+        rows, position = read_log_lines(log_path, position)
+        for time_string, event in rows:
+            time_seconds = utils.utils.log_time2seconds(time_string)
+            state = utils.utils.log_step(output, state, time_seconds, event)
+        utils.utils.close_log(
+            output, state, utils.ffmpeg.media_duration(video_path, recorded)
+        )
+        print(f"INFO: Recording stopped, {len(output) - dispatched} events left")
+        if fps is None:
+            fps = utils.ffmpeg.frame_rate(video_path)
+        while dispatched < len(output):
+            dispatch(dispatched, len(output))
+            dispatched += 1
+
+        errors = []
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"ERROR: Event {futures[future]} failed")
+                traceback.print_exception(type(e), e, e.__traceback__)
+                errors.append(futures[future])
+
+    if errors:
+        raise Exception(f"Failed events: {sorted(errors)}")
+
+    return events
+
+
+def simulate_obs(source, log_rows, video_path, log_path, speed=1.0, debug=False):
+    """Writes a recording and its log as OBS does (for testing the watch mode): the
+    source is copied into a growing MKV file at speed times real time while the log
+    rows are appended when the recording reaches their time
+
+    Args:
+        source (string): finished recording
+        log_rows (list): [time_string, event] rows of its log
+        video_path (string): growing recording (MKV)
+        log_path (string): growing log file
+        speed (float, optional): times faster than real time. Defaults to 1.0.
+    """
+    if debug:
+        buf = None  # print to terminal
+    else:
+        buf = subprocess.DEVNULL
+    command = [
+        "ffmpeg",
+        "-y",
+        "-readrate",
+        f"{speed}",
+        "-i",
+        f"{source}",
+        "-c",
+        "copy",
+        "-flush_packets",
+        "1",
+        "-f",
+        "matroska",
+        f"{video_path}",
+    ]
+    open(log_path, "w").close()
+    process = subprocess.Popen(command, stdout=buf, stderr=buf)
+    start = time.time()
+    for time_string, event in log_rows:
+        wait = utils.utils.log_time2seconds(time_string) / speed - (time.time() - start)
+        if wait > 0:
+            time.sleep(wait)
+        with open(log_path, "a") as file:
+            file.write(f"{time_string},{event}\n")
+    if process.wait() != 0:
+        raise Exception(f"ffmpeg failed writing {video_path}")
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    import threading
+
+    # python -m utils.watch <recording> <log.txt> [speed]
+    sys.path.insert(0, os.getcwd())
+    import video_editor
+
+    source, source_log = sys.argv[1], sys.argv[2]
+    speed = float(sys.argv[3]) if len(sys.argv) > 3 else 4.0
+
+    folder = os.path.join(tempfile.gettempdir(), "video_editing_watch")
+    temp_folder = os.path.join(folder, "temp")
+    os.makedirs(temp_folder, exist_ok=True)
+    video_path = os.path.join(folder, "recording.mkv")
+    log_path = os.path.join(folder, "log.txt")
+
+    with open(source_log) as file:
+        log_rows = [row for row in csv.reader(file, delimiter=",") if row]
+    writer = threading.Thread(
+        target=simulate_obs, args=(source, log_rows, video_path, log_path, speed)
+    )
+    writer.start()
+
+    start = time.time()
+    param = dict(video_editor.param, TRACE_FILE=None, WATCH_IDLE_SECONDS=3)
+    event_times = watch_recording(
+        video_path, log_path, temp_folder, param, video_editor.process_event
+    )
+    writer.join()
+    utils.utils.print_timestamps(event_times)
+    utils.video.concatenate_videos(
+        [os.path.join(temp_folder, f"output{i}.mp4") for i in range(len(event_times))],
+        os.path.join(folder, "final_video.mp4"),
+    )
+    print(f"Total time: {time.time() - start:.1f} s")
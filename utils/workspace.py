@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+
+import utils.instrument
+
+# Memory backed folder for the small intermediates (Linux)
+TMPFS_FOLDER = "/dev/shm"
+
+
+def hot_folder(folder):
+    """tmpfs twin of a workspace folder (see Workspace), the folder itself if it has
+    none. Workers find it from the workspace folder alone"""
+    twin = os.path.join(TMPFS_FOLDER, os.path.basename(folder))
+    return twin if os.path.isdir(twin) else folder
+
+
+class Workspace:
+    """Folder of the intermediate files of one run, unique so concurrent runs do not
+    clobber each other. Small hot intermediates go to a tmpfs twin folder, each
+    intermediate is deleted as soon as its last consumer finishes. The byte budget is
+    a pre-check (reserve raises before the big intermediates are produced), the usage
+    is then only sampled when a file is produced or consumed (warning over budget).
+    Used as a context manager, the workspace is deleted even if the run fails
+
+    Args:
+        parent (string): folder where the workspace is created (disk)
+        prefix (string, optional): prefix of the workspace name. Defaults to "video_editing_".
+        budget_bytes (float, optional): maximum usage, None is unlimited. Defaults to None.
+        tmpfs (bool, optional): small intermediates in tmpfs. Defaults to True.
+    """
+
+    def __init__(self, parent, prefix="video_editing_", budget_bytes=None, tmpfs=True):
+        os.makedirs(parent, exist_ok=True)
+        self.folder = tempfile.mkdtemp(prefix=prefix, dir=parent)
+        self.hot_folder = self.folder
+        if tmpfs and os.access(TMPFS_FOLDER, os.W_OK):
+            self.hot_folder = os.path.join(TMPFS_FOLDER, os.path.basename(self.folder))
+            os.mkdir(self.hot_folder)
+        self.budget_bytes = budget_bytes
+        self.consumers = {}  # path: consumers that have not finished yet
+        self.peak_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def path(self, filename, hot=False):
+        return os.path.join(self.hot_folder if hot else self.folder, filename)
+
+    def usage(self):
+        """Bytes used now (updates the peak)"""
+        used = utils.instrument.folder_bytes(self.folder)
+        if self.hot_folder != self.folder:
+            used += utils.instrument.folder_bytes(self.hot_folder)
+        self.peak_bytes = max(self.peak_bytes, used)
+        return used
+
+    def reserve(self, n_bytes, description):
+        """Raises if n_bytes more would not fit in the budget (before producing them)"""
+        if self.budget_bytes is None:
+            return
+        needed = self.usage() + n_bytes
+        if needed > self.budget_bytes:
+            raise Exception(
+                f"Workspace budget exceeded by {description}: {needed / 1e9:.2f} GB "
+                f"> {self.budget_bytes / 1e9:.2f} GB"
+            )
+
+    def produced(self, path, consumers):
+        """Registers an intermediate file and the consumers that read it
+
+        Args:
+            path (string): intermediate file (it may not exist yet)
+            consumers (iterable): ids of the consumers (i.e. ("event", 3) or "concat")
+        """
+        self.consumers[path] = set(consumers)
+        if self.budget_bytes is not None and self.usage() > self.budget_bytes:
+            print(
+                f"WARNING: Workspace over budget ({self.usage() / 1e9:.2f} GB > "
+                f"{self.budget_bytes / 1e9:.2f} GB)"
+            )
+
+    def consumed(self, consumer):
+        """A consumer finished: deletes the files that no other consumer reads"""
+        self.usage()  # peak before deleting
+        for path, consumers in list(self.consumers.items()):
+            consumers.discard(consumer)
+            if not consumers:
+                if os.path.exists(path):
+                    os.remove(path)
+                del self.consumers[path]
+
+    def close(self):
+        """Deletes the workspace and prints its peak usage"""
+        self.usage()
+        shutil.rmtree(self.folder, ignore_errors=True)
+        if self.hot_folder != self.folder:
+            shutil.rmtree(self.hot_folder, ignore_errors=True)
+        print(f"INFO: Workspace peak usage: {self.peak_bytes / 1e6:.1f} MB")
@@ -1,16 +1,28 @@
-import concurrent.futures
-import moviepy.editor as mpye
-from pydub import AudioSegment, effects
+import utils.startup  # first: the startup time includes the other imports
 import time
+import numpy as np
+import concurrent.futures
+import contextlib
 import tempfile
 import os
-import itertools
-import concurrent.futures
+import sys
 
 import utils.utils
 import utils.audio
 import utils.video
+import utils.ffmpeg
+import utils.cache
+import utils.scheduler
+import utils.instrument
+import utils.watch
+import utils.proxy
+import utils.timeline
+import utils.plan
+import utils.probe
+import utils.workspace
 
+# moviepy (imageio, ffmpeg probing) and pydub are imported by the functions that use
+# them, the subcommands that do not render start without them (see warm_worker)
 
 # Parameters
 param = {
@@ -23,6 +35,12 @@ param = {
     # if greater than one, time in seconds
     # Audio modificaiton
     "NORMALISE_SOUND": True,
+    # Loudness (EBU R128) measured once for the whole recording, each event gets the
+    # gain that brings it to the target (peak normalisation if there is no plan)
+    "LOUDNESS_TARGET_LUFS": -16,
+    "LOUDNESS_EVENT_RANGE_dB": 3,  # maximum deviation from the recording gain
+    "LOUDNESS_PEAK_dBFS": -1.0,
+    "AUDIO_SAMPLE_RATE": 44100,  # Hz
     "SILENCE_BETWEEN_SECTIONS": 0,  # milliseconds
     "START_VIDEO_SILENCE": 500,  # milliseconds
     "END_VIDEO_SILENCE": 1000,  # milliseconds
@@ -34,257 +52,1238 @@ param = {
     "FADE_POST_MARGIN": 100,  # milliseconds
     "MAX_SPEEDX": 5,  # times faster video
     "CROSSFADEIN_DURATION": 1.5,  # seconds
-    "MISSING_IMAGE_TIMEOUT": int(5.0),  # seconds
+    # Render profile (preview: fast low resolution review pass)
+    "RENDER_PROFILE": "final",
+    "RENDER_PROFILES": {
+        "preview": {
+            "codec": "libx264",
+            "preset": "ultrafast",
+            "crf": 32,
+            "height": 360,  # pixels (None: source resolution)
+            "fps": 15,  # None: source frame rate
+            "audio_channels": 1,
+            "audio_bitrate": "64k",
+            "encode_speed": 6.0,  # seconds of video rendered per second by a worker
+        },
+        "final": {
+            "codec": "libx264",
+            "preset": "medium",
+            "crf": 20,
+            "height": None,
+            "fps": None,
+            "audio_channels": 2,
+            "audio_bitrate": "192k",
+            "encode_speed": 1.5,
+        },
+    },
+    "SINGLE_ENCODE": False,  # whole video in one ffmpeg pass (no segments)
+    "RENDER_BACKEND": "moviepy",  # moviepy / ffmpeg (single filtergraph per event)
+    "SMART_CUT": True,  # raw events: copy whole GOPs, encode only the edges and audio
+    # Scheduler (None: computed from the CPU and memory budgets)
+    "MAX_WORKERS": None,
+    "ENCODER_THREADS": 2,  # threads of each encoder
+    "WORKER_MEMORY_GB": 1.5,  # peak memory of each worker
+    "MEMORY_BUDGET_GB": None,  # None: physical memory
+    "SPLIT_WORKERS": 4,  # ffmpeg processes extracting segments at once
+    "BATCH_VIDEOS": 2,  # videos detected / split / joined at once (batch.py)
+    # Workspace of each run (segments and outputs on disk, small files in tmpfs)
+    "WORKSPACE_FOLDER": tempfile.gettempdir(),
+    "WORKSPACE_BUDGET_GB": None,  # None: no limit
+    "WORKSPACE_TMPFS": True,
+    # Watch mode (edit while recording)
+    "WATCH_POLL_SECONDS": 1.0,
+    "WATCH_IDLE_SECONDS": 10,  # recording stopped when its size does not change
+    # Instrumentation (Chrome trace, None disables it, each run adds its start time
+    # and process id to the name) and stages run under cProfile
+    "TRACE_FILE": os.path.join(tempfile.gettempdir(), "video_editing_trace.json"),
+    "PROFILE_STAGES": [],  # i.e. ["audio_edit", "write"]
+    # Render cache (reuse unchanged segments between runs)
+    "CACHE": True,
+    "CACHE_FOLDER": os.path.join(tempfile.gettempdir(), "video_editing_cache"),
+    "CACHE_MAX_GB": 20,
     # Silence detection parameters
     "MIN_SILENCE_MS": 5000,
-    "SILENCE_THRESHOLD_dB": -40,  # -16 / -40 OK
+    "SILENCE_THRESHOLD_dB": -40,  # -16 / -40 OK, None: adaptive (envelope only)
+    # numpy: the pydub boundaries exactly, without its Python loop
+    # stream: audio decoded with an ffmpeg pipe as low rate mono (constant memory),
+    # pydub criteria on that audio (approximate boundaries)
+    # envelope: loudness envelope cached next to the recording, re-tuning the
+    # threshold or minimum length does not decode the audio again
+    "SILENCE_DETECTOR": "numpy",  # numpy / pydub / stream / envelope
+    "SILENCE_ENVELOPE_MS": 10,  # block length of the envelope
+    "SILENCE_SAMPLE_RATE": 8000,  # Hz (stream and envelope)
     # Colour palette
     "REMOVE_COLOUR_PALETTE": False,
     "REMOVE_COLOUR_PALETTE_INTERVAL": 1.0,  # seconds
+    # Proxy (silence and colour palette are detected in a low resolution copy)
+    "PROXY": False,
+    "PROXY_HEIGHT": 360,  # pixels
+    "PROXY_FPS": 10,
+    "PROXY_WHITE_LEVEL": 240,  # white probe pixels after the lossy proxy encode
 }
 
 
-def process_event(i, n_events, event, temp_folder, param):
-    print(f"Processing: {i+1:2} / {n_events}")
+def render_profile(param):
+    """Render profile selected in param (see RENDER_PROFILES)"""
+    if param["RENDER_PROFILE"] not in param["RENDER_PROFILES"]:
+        raise Exception(f"Unknown render profile: {param['RENDER_PROFILE']}")
+    return param["RENDER_PROFILES"][param["RENDER_PROFILE"]]
 
-    video = mpye.VideoFileClip(os.path.join(temp_folder, f"video_segment_{i}.mp4"))
 
-    # Save last visual frame (for crossfade)
-    image_path = os.path.join(temp_folder, f"last_visual_frame{i}.jpg")
-    utils.utils.export_last_visual_frame(video, event, image_path)
+def raw_event_audio(samples, sample_rate, param, gain_db=None):
+    channels = samples.shape[1]
 
-    if event["mode"] == "raw":
-        # It is necessary since the extracted video may be longer than expected
-        video = video.subclip(0, event["both"][1] - event["both"][0])
-
-        # Save video audio to file
-        audio = video.audio
-        temp_audio_file = os.path.join(temp_folder, f"temp_audio{i}.wav")
-        if os.path.exists(temp_audio_file):
-            os.remove(temp_audio_file)
-        audio.write_audiofile(temp_audio_file)
-        video_audio = AudioSegment.from_file(temp_audio_file, temp_audio_file[-3:])
-
-        # Silence extreme parts
-        audio_segment = video_audio[
-            0
-            + param["SILENCE_PRE_MARGIN"] : video.duration * 1000
-            - param["SILENCE_POST_MARGIN"]
+    # Silence extreme parts
+    audio_segment = samples[
+        utils.audio.ms2frames(param["SILENCE_PRE_MARGIN"], sample_rate) : len(samples)
+        - utils.audio.ms2frames(param["SILENCE_POST_MARGIN"], sample_rate)
+    ]
+
+    audio_segment = np.concatenate(
+        [
+            utils.audio.silent(param["SILENCE_PRE_MARGIN"], sample_rate, channels),
+            audio_segment,
+            utils.audio.silent(param["SILENCE_POST_MARGIN"], sample_rate, channels),
         ]
+    )
+
+    # Normalize audio (gain of the loudness pass, peak normalisation without it)
+    if param["NORMALISE_SOUND"]:
+        with utils.instrument.stage("normalise"):
+            if gain_db is None:
+                audio_segment = utils.audio.normalize(audio_segment)
+            else:
+                audio_segment = utils.audio.apply_gain(
+                    audio_segment, gain_db, param["LOUDNESS_PEAK_dBFS"]
+                )
+
+    return audio_segment
+
+
+def edit_event_audio(i, n_events, talk, samples, sample_rate, param, gain_db=None):
+    """talk: (start, end) sample of the talk section (see Event.section_samples)"""
+    channels = samples.shape[1]
+
+    if param["NORMALISE_SOUND"] and gain_db is None:
+        with utils.instrument.stage("normalise"):
+            samples = utils.audio.normalize(samples)
+
+    start = talk[0] + utils.audio.ms2frames(param["SILENCE_PRE_MARGIN"], sample_rate)
+    end = talk[1] - utils.audio.ms2frames(param["SILENCE_POST_MARGIN"], sample_rate)
+    audio_segment = samples[start:end]
+    if param["NORMALISE_SOUND"] and gain_db is not None:
+        with utils.instrument.stage("normalise"):
+            audio_segment = utils.audio.apply_gain(
+                audio_segment, gain_db, param["LOUDNESS_PEAK_dBFS"]
+            )
 
-        audio_segment = (
-            AudioSegment.silent(duration=param["SILENCE_PRE_MARGIN"])
-            + audio_segment
-            + AudioSegment.silent(duration=param["SILENCE_POST_MARGIN"])
+    audio_segment = utils.audio.fade(
+        audio_segment, sample_rate, param["FADE_PRE_MARGIN"], param["FADE_POST_MARGIN"]
+    )
+    parts = [
+        utils.audio.silent(param["SILENCE_PRE_MARGIN"], sample_rate, channels),
+        audio_segment,
+        utils.audio.silent(param["SILENCE_POST_MARGIN"], sample_rate, channels),
+    ]
+
+    # Add Silence
+    if i == 0:  # Video start
+        parts.insert(
+            0, utils.audio.silent(param["START_VIDEO_SILENCE"], sample_rate, channels)
+        )
+    parts.append(
+        utils.audio.silent(param["SILENCE_BETWEEN_SECTIONS"], sample_rate, channels)
+    )
+    if n_events is not None and i == n_events - 1:  # Video end (None: unknown yet)
+        parts.append(
+            utils.audio.silent(param["END_VIDEO_SILENCE"], sample_rate, channels)
+        )
+
+    return np.concatenate(parts)
+
+
+def process_event(
+    i,
+    n_events,
+    event,
+    temp_folder,
+    param,
+    previous_event=None,
+    segment_key=None,
+    gain_db=None,
+    media=None,
+):
+    utils.instrument.configure(
+        param["TRACE_FILE"], param["PROFILE_STAGES"], temp_folder
+    )
+    with utils.instrument.stage("process_event", event=i, mode=event["mode"]):
+        return _process_event(
+            i,
+            n_events,
+            event,
+            temp_folder,
+            param,
+            previous_event,
+            segment_key,
+            gain_db,
+            media,
+        )
+
+
+def _process_event(
+    i, n_events, event, temp_folder, param, previous_event, segment_key, gain_db, media
+):
+    import moviepy.editor as mpye
+    from moviepy.audio.AudioClip import AudioArrayClip
+
+    print(f"Processing: {i+1:2} / {n_events or '?'}")
+
+    # Cache keys (before the event is modified)
+    cache = None
+    if segment_key is not None:
+        cache = utils.cache.RenderCache(
+            param["CACHE_FOLDER"], param["CACHE_MAX_GB"] * 1e9
+        )
+        audio_key = utils.cache.make_key(
+            segment_key,
+            event,
+            i == 0,
+            n_events is not None and i == n_events - 1,
+            {key: param[key] for key in utils.cache.AUDIO_PARAMETERS},
+            render_profile(param)["audio_channels"],
+            gain_db,
         )
+        output_key = utils.cache.make_key(
+            audio_key,
+            previous_event,
+            {key: param[key] for key in utils.cache.VIDEO_PARAMETERS},
+            render_profile(param),
+        )
+        if cache.fetch(output_key, os.path.join(temp_folder, f"output{i}.mp4")):
+            print(f"{i} - CACHED")
+            return cache.stats()
+
+    # Metadata of the segment (see utils.probe), only the moviepy render opens it
+    segment_path = os.path.join(temp_folder, f"video_segment_{i}.mp4")
+    if media is None:  # i.e. watch mode
+        media = utils.probe.probe_media(segment_path)
+    fps = media["fps"]
+    profile = render_profile(param)
+    backend = param["RENDER_BACKEND"]
+
+    # Audio is decoded once and edited in memory
+    sample_rate = param["AUDIO_SAMPLE_RATE"]
+    audio_segment = None
+    if cache is not None:
+        audio_segment = cache.fetch_array(audio_key)
+    if audio_segment is None:
+        with utils.instrument.stage("audio_decode", event=i):
+            samples = utils.audio.decode_audio(
+                segment_path,
+                sample_rate,
+                profile["audio_channels"],
+            )
+
+    if event["mode"] == "raw":
+        # Segments start at a keyframe before the event
+        offset = event["offset"]
+        duration = event.n_frames("both") / event.fps  # exact number of frames
 
-        # Normalize audio
-        if param["NORMALISE_SOUND"]:
-            audio_segment = effects.normalize(audio_segment)
+        if audio_segment is None:
+            # Sample grid of the segment (it starts offset_frames before the event)
+            start, end = event.section_samples(
+                "both", sample_rate, event.frames[0] - event.offset_frames
+            )
+            samples = samples[start:end]
+            with utils.instrument.stage("audio_edit", event=i):
+                audio_segment = raw_event_audio(samples, sample_rate, param, gain_db)
+            if cache is not None:
+                cache.store_array(audio_key, audio_segment)
 
-        audio_segment_path = os.path.join(temp_folder, f"audio{i}.wav")
-        audio_segment.export(audio_segment_path, format=audio_segment_path[-3:])
+        # Smart cut: the video is not modified, only the GOPs at its edges are encoded
+        cut_points = None
+        if smart_cut_allowed(media, profile, param):
+            cut_points = utils.ffmpeg.smart_cut_points(
+                media["keyframes"],
+                [offset, offset + duration],
+                param["CROSSFADEIN_DURATION"] if previous_event is not None else 0,
+            )
 
-        audio_clip = mpye.AudioFileClip(audio_segment_path)
-        video = video.set_audio(audio_clip)
+        if cut_points is not None:
+            backend = "smart_cut"
+            render = {"trim": [offset, offset + duration], "cut_points": cut_points}
+        elif backend == "ffmpeg":
+            render = {"trim": [offset, offset + duration]}
+        else:
+            source_clip = mpye.VideoFileClip(segment_path)
+            video = source_clip.subclip(offset, offset + duration)
+            audio_clip = AudioArrayClip(audio_segment, fps=sample_rate)
+            video = video.set_audio(audio_clip)
 
     elif event["mode"] == "edit":
         # ----------------------- AUDIO EDITION ---------------------------------
         # Get non-silent (talking) audio segments
-        talk = event["talk"]
-        talk[0] -= event["draw"][0]  # relative to video segment start
-        talk[1] -= event["draw"][0]  # relative to video segment start
-
-        audio = video.audio
-        temp_audio_file = os.path.join(temp_folder, f"temp_audio{i}.wav")
-        if os.path.exists(temp_audio_file):
-            os.remove(temp_audio_file)
-        audio.write_audiofile(temp_audio_file)
-        video_audio = AudioSegment.from_file(temp_audio_file, temp_audio_file[-3:])
-
-        if param["NORMALISE_SOUND"]:
-            video_audio = effects.normalize(video_audio)
-
-        audio_segment = video_audio[
-            talk[0] * 1000
-            + param["SILENCE_PRE_MARGIN"] : talk[1] * 1000
-            - param["SILENCE_POST_MARGIN"]
-        ]
+        # Segments start at a keyframe before the event (frames of the segment)
+        segment_start = event.section_frames("draw")[0] - event.offset_frames
+        talk = event.section_samples("talk", sample_rate, segment_start)
+
+        if audio_segment is None:
+            with utils.instrument.stage("audio_edit", event=i):
+                audio_segment = edit_event_audio(
+                    i, n_events, talk, samples, sample_rate, param, gain_db
+                )
+            if cache is not None:
+                cache.store_array(audio_key, audio_segment)
+
+        # ----------------------- VIDEO EDITION ---------------------------------
+        draw = [
+            (frame - segment_start) / event.fps
+            for frame in event.section_frames("draw")
+        ]  # relative to splitted video
+
+        # Colour palette intervals (relative to the draw section)
+        palette_intervals = []
+        if param["REMOVE_COLOUR_PALETTE"]:
+            print(f"{i} removing colour palette")
+            proxy = utils.proxy.proxy_path(temp_folder)
+            with utils.instrument.stage("colour_palette", event=i):
+                if param["PROXY"] and os.path.exists(proxy):
+                    # The proxy has the timestamps of the original recording
+                    palette_intervals = utils.video.colour_palette_intervals_stream(
+                        proxy,
+                        event["draw"][0],
+                        event["draw"][1],
+                        param["REMOVE_COLOUR_PALETTE_INTERVAL"],
+                        utils.proxy.scale(media["height"], param),
+                        param["PROXY_WHITE_LEVEL"],
+                    )
+                else:
+                    palette_intervals = utils.video.colour_palette_intervals_stream(
+                        segment_path,
+                        draw[0],
+                        draw[1],
+                        param["REMOVE_COLOUR_PALETTE_INTERVAL"],
+                    )
+            print(f"{i} removing colour palette - DONE")
+
+        video_duration = draw[1] - draw[0]
+        video_duration -= sum(b - a for a, b in palette_intervals)
+        extend_duration = utils.video.extension_duration(
+            video_duration, param["EXTEND_LAST_FRAME"]
+        )
+        video_duration += extend_duration
 
-        audio_segment.fade_in(param["FADE_PRE_MARGIN"]).fade_out(
-            param["FADE_POST_MARGIN"]
+        # Speedup to the audio duration (capped, then the talk is followed by silence)
+        speedup, output_duration = capped_speedup(
+            video_duration, len(audio_segment) / sample_rate, param
         )
-        audio_segment = (
-            AudioSegment.silent(duration=param["SILENCE_PRE_MARGIN"])
-            + audio_segment
-            + AudioSegment.silent(duration=param["SILENCE_POST_MARGIN"])
+        print(f"{i} Speedup: {speedup:.2f}")
+        audio_segment = pad_audio(audio_segment, output_duration, sample_rate)
+
+        # Whole number of output frames, the video is sped up to the same duration
+        audio_segment, n_frames = utils.timeline.pad_to_frames(
+            audio_segment, sample_rate, fps
         )
+        speedup = video_duration / (n_frames / fps)
+
+        # Frames dropped by the speedup are not decoded (palette cuts number them)
+        input_options = []
+        if not palette_intervals:
+            input_options = utils.ffmpeg.decimation_options(
+                speedup, fps, profile["fps"], media
+            )
 
-        # Add Silence
-        if i == 0:  # Video start
-            audio_segment = (
-                AudioSegment.silent(duration=param["START_VIDEO_SILENCE"])
-                + audio_segment
+        if backend == "ffmpeg":
+            render = {
+                "trim": draw,
+                "cut_intervals": palette_intervals,
+                "extend_duration": extend_duration,
+                "speedup": speedup,
+                "input_options": input_options,
+            }
+        else:
+            audio_clip = AudioArrayClip(audio_segment, fps=sample_rate)
+            output_fps = profile["fps"] or fps
+            video = utils.video.decimated_clip(
+                segment_path,
+                draw,
+                fps,
+                round(n_frames * output_fps / fps),
+                (media["width"], media["height"]),
+                palette_intervals,
+                extend_duration,
+                speedup,
+                output_fps,
+                input_options,
             )
-        audio_segment = audio_segment + AudioSegment.silent(
-            duration=param["SILENCE_BETWEEN_SECTIONS"]
+            video = video.set_audio(audio_clip)
+
+    # Crossfade from last visual frame of the previous event, taken directly from
+    # its video segment (no need to wait for the previous worker)
+    if previous_event is not None:
+        previous_segment = os.path.join(temp_folder, f"video_segment_{i-1}.mp4")
+        previous_time = max(
+            utils.utils.last_visual_frame_time(previous_event) - 1.0 / fps, 0
         )
-        if i == n_events - 1:  # Video end
-            audio_segment = audio_segment + AudioSegment.silent(
-                duration=param["END_VIDEO_SILENCE"]
+
+    output_path = os.path.join(temp_folder, f"output{i}.mp4")
+    if backend in ("ffmpeg", "smart_cut"):
+        if previous_event is not None:
+            render["crossfade_source"] = previous_segment
+            render["crossfade_time"] = previous_time
+    if backend == "smart_cut":
+        with utils.instrument.stage("write", event=i, backend="smart_cut"):
+            utils.ffmpeg.smart_cut_event(
+                segment_path,
+                audio_segment,
+                sample_rate,
+                output_path,
+                parts_prefix=os.path.join(
+                    utils.workspace.hot_folder(temp_folder), f"smart_cut{i}"
+                ),
+                fps=fps,
+                crossfade_duration=param["CROSSFADEIN_DURATION"],
+                threads=param["ENCODER_THREADS"],
+                profile=profile,
+                **render,
+            )
+    elif backend == "ffmpeg":
+        with utils.instrument.stage("write", event=i, backend="ffmpeg"):
+            utils.ffmpeg.render_event(
+                segment_path,
+                audio_segment,
+                sample_rate,
+                output_path,
+                fps=fps,
+                crossfade_duration=param["CROSSFADEIN_DURATION"],
+                threads=param["ENCODER_THREADS"],
+                profile=profile,
+                **render,
             )
+    else:
+        if previous_event is not None:
+            with utils.instrument.stage("crossfade", event=i):
+                previous_video = mpye.VideoFileClip(previous_segment)
+                last_frame = previous_video.get_frame(previous_time)
+                previous_video.close()
+                image_clip = mpye.ImageClip(last_frame).set_duration(
+                    param["CROSSFADEIN_DURATION"]
+                )
 
-        audio_segment_path = os.path.join(temp_folder, f"audio{i}.wav")
-        audio_segment.export(audio_segment_path, format=audio_segment_path[-3:])
+                video_crossfade = video.subclip(0, param["CROSSFADEIN_DURATION"])
+                video_crossfade = video_crossfade.crossfadein(
+                    param["CROSSFADEIN_DURATION"]
+                )
+                video_crossfade = mpye.CompositeVideoClip([image_clip, video_crossfade])
 
-        audio_clip = mpye.AudioFileClip(audio_segment_path)
+                # Single encode of crossfade + rest of the event
+                video = mpye.concatenate_videoclips(
+                    [
+                        video_crossfade,
+                        video.subclip(t_start=param["CROSSFADEIN_DURATION"]),
+                    ]
+                )
 
-        # ----------------------- VIDEO EDITION ---------------------------------
-        # Extract video files
-        draw = [0, event["draw"][1] - event["draw"][0]]  # relative to splitted video
-        video = video.subclip(draw[0], draw[1])
+        # Profile resolution (crossfade included)
+        if profile["height"]:
+            video = video.resize(height=profile["height"])
+
+        # Unset encoder options keep the moviepy / libx264 defaults (as
+        # utils.ffmpeg.encoder_arguments)
+        ffmpeg_params = []
+        if profile.get("crf") is not None:
+            ffmpeg_params += ["-crf", f"{profile['crf']}"]
+        with utils.instrument.stage("write", event=i, backend="moviepy"):
+            video.write_videofile(
+                output_path,
+                fps=profile["fps"] or fps,
+                codec=profile["codec"],
+                preset=profile.get("preset") or "medium",
+                audio_bitrate=profile.get("audio_bitrate"),
+                threads=param["ENCODER_THREADS"],
+                ffmpeg_params=ffmpeg_params,
+            )
+        # Workers are reused (batch mode), their decoders must not outlive the event
+        if event["mode"] == "raw":
+            source_clip.close()
+
+    print(f"{i} - COMPLETELY DONE")
+
+    if cache is not None:
+        cache.store(output_key, output_path)
+        return cache.stats()
+
+
+def smart_cut_allowed(media, profile, param):
+    """Raw events can be stream copied if the profile keeps the resolution, frame
+    rate, codec (H.264) and bitstream format (profile and pixel format, see
+    utils.ffmpeg.SMART_CUT_FORMAT) of the recording (media index, see utils.probe)"""
+    if not param["SMART_CUT"] or profile["height"] or profile["fps"]:
+        return False
+    # ultrafast encodes Constrained Baseline, the copied GOPs would not match
+    if profile["codec"] != "libx264" or profile["preset"] == "ultrafast":
+        return False
+    return media["video_codec"] == "h264" and all(
+        media.get(key) == value for key, value in utils.ffmpeg.SMART_CUT_FORMAT.items()
+    )
 
-        # Video Modifications
+
+def capped_speedup(video_duration, audio_duration, param):
+    """Speedup of an edit event (its video lasts as its audio) capped at MAX_SPEEDX
+
+    Returns:
+        tuple: (speedup, output duration), longer than the audio if capped
+    """
+    speedup = min(video_duration / audio_duration, param["MAX_SPEEDX"])
+    return speedup, max(video_duration / speedup, audio_duration)
+
+
+def pad_audio(samples, duration, sample_rate):
+    """Silence added at the end of the audio up to duration (seconds)"""
+    n_samples = round(duration * sample_rate) - len(samples)
+    if n_samples <= 0:
+        return samples
+    padding = np.zeros((n_samples, samples.shape[1]), dtype=samples.dtype)
+    return np.concatenate([samples, padding])
+
+
+def edited_audio_duration(i, n_events, event, param):
+    """Duration of the audio produced by raw_event_audio / edit_event_audio (seconds)"""
+    if event["mode"] == "raw":
+        return event["both"][1] - event["both"][0]
+
+    silence_ms = param["SILENCE_BETWEEN_SECTIONS"]
+    if i == 0:
+        silence_ms += param["START_VIDEO_SILENCE"]
+    if n_events is not None and i == n_events - 1:
+        silence_ms += param["END_VIDEO_SILENCE"]
+    return event["talk"][1] - event["talk"][0] + silence_ms / 1000
+
+
+def timeline_item(
+    i,
+    n_events,
+    event,
+    previous_event,
+    source,
+    fps,
+    param,
+    proxy=None,
+    proxy_scale=1.0,
+    index=None,
+):
+    """Edition of one event referenced to the original video (see render_timeline),
+    the colour palette is searched in the proxy if there is one and the decoder skips
+    the frames dropped by the speedup (index: media index of the original video)"""
+    if event["mode"] == "raw":
+        item = {"start": event["both"][0], "end": event["both"][1], "speedup": 1.0}
+        item["cut_intervals"] = None
+        item["extend_duration"] = 0
+        item["duration"] = event.n_frames("both") / fps
+        item["input_options"] = []
+    elif event["mode"] == "edit":
+        item = {"start": event["draw"][0], "end": event["draw"][1]}
+        item["cut_intervals"] = []
         if param["REMOVE_COLOUR_PALETTE"]:
-            print(f"{i} removing colour palette")
-            video = utils.video.remove_colur_palette(
-                video, param["REMOVE_COLOUR_PALETTE_INTERVAL"]
+            if proxy is None:
+                item["cut_intervals"] = utils.video.colour_palette_intervals_stream(
+                    source,
+                    item["start"],
+                    item["end"],
+                    param["REMOVE_COLOUR_PALETTE_INTERVAL"],
+                )
+            else:
+                item["cut_intervals"] = utils.video.colour_palette_intervals_stream(
+                    proxy,
+                    item["start"],
+                    item["end"],
+                    param["REMOVE_COLOUR_PALETTE_INTERVAL"],
+                    proxy_scale,
+                    param["PROXY_WHITE_LEVEL"],
+                )
+        video_duration = item["end"] - item["start"]
+        video_duration -= sum(b - a for a, b in item["cut_intervals"])
+        item["extend_duration"] = utils.video.extension_duration(
+            video_duration, param["EXTEND_LAST_FRAME"]
+        )
+        video_duration += item["extend_duration"]
+
+        # Speedup (capped, the audio is padded to the output duration)
+        _, output_duration = capped_speedup(
+            video_duration, edited_audio_duration(i, n_events, event, param), param
+        )
+
+        # Whole number of output frames (the fps filter rounds each event before the
+        # concat), the video is sped up to the same duration (see process_event)
+        sample_rate = param["AUDIO_SAMPLE_RATE"]
+        n_frames = utils.timeline.output_frames(
+            round(output_duration * sample_rate), sample_rate, fps
+        )
+        item["duration"] = n_frames / fps
+        item["speedup"] = video_duration / item["duration"]
+        print(f"{i} Speedup: {item['speedup']:.2f}")
+        item["input_options"] = []
+        if not item["cut_intervals"]:
+            item["input_options"] = utils.ffmpeg.decimation_options(
+                item["speedup"], fps, render_profile(param)["fps"], index
             )
-            print(f"{i} removing colour palette - DONE")
-        video = utils.video.extend_last_frame(video, param["EXTEND_LAST_FRAME"])
-
-        # Speedup
-        same_duration_ratio = video.duration / audio_clip.duration
-        speedup_ratio = min(same_duration_ratio, param["MAX_SPEEDX"])
-        print(f"{i} Speedup: {speedup_ratio:.2f}")
-        video = video.fx(mpye.vfx.speedx, same_duration_ratio)
-        # TODO: check if need to add silence to audio
-        video = video.set_audio(audio_clip)
-
-        # Mod frame time (fix Error: Index out of bound issue)
-        frame_time = 1.0 / video.fps
-        mod_frame_time = video.duration % frame_time
-        if mod_frame_time != 0.0:
-            video = video.subclip(t_end=video.duration - mod_frame_time)
-
-    # Crossfade from last visual frame
-    if i != 0:
-        image_path = os.path.join(temp_folder, f"last_visual_frame{i-1}.jpg")
-        for _ in range(param["MISSING_IMAGE_TIMEOUT"]):
-            if os.path.exists(image_path):
-                break
-            time.sleep(1.0)
+    else:
+        raise Exception(f"Unkown event mode: {event['mode']}")
+
+    # Crossfade from last visual frame (absolute time in the original video)
+    item["crossfade_time"] = None
+    if previous_event is not None:
+        if previous_event["mode"] == "raw":
+            previous_end = previous_event["both"][1]
         else:
-            raise Exception(f"Timeout: Missing image {i-1}")
+            previous_end = previous_event["draw"][1]
+        item["crossfade_time"] = max(previous_end - 1.0 / fps, 0)
 
-        image_clip = mpye.ImageClip(image_path).set_duration(
-            param["CROSSFADEIN_DURATION"]
+    return item
+
+
+def timeline_audio(event_times, durations, source, param, gains=None):
+    """Edited audio of each event, decoded from the original video one at a time and
+    padded with silence (or trimmed by the rounding of its samples) to the duration of
+    its video, a whole number of frames (see timeline_item)"""
+    sample_rate = param["AUDIO_SAMPLE_RATE"]
+    channels = render_profile(param)["audio_channels"]
+    gains = gains or [None] * len(event_times)
+    for i, (event, gain_db, duration) in enumerate(zip(event_times, gains, durations)):
+        if event["mode"] == "raw":
+            samples = utils.audio.decode_audio(
+                source,
+                sample_rate,
+                channels,
+                t_start=event["both"][0],
+                duration=event["both"][1] - event["both"][0],
+            )
+            samples = raw_event_audio(samples, sample_rate, param, gain_db)
+        else:
+            samples = utils.audio.decode_audio(
+                source,
+                sample_rate,
+                channels,
+                t_start=event["draw"][0],
+                duration=event["talk"][1] - event["draw"][0],
+            )
+            talk = event.section_samples(
+                "talk", sample_rate, event.section_frames("draw")[0]
+            )
+            samples = edit_event_audio(
+                i, len(event_times), talk, samples, sample_rate, param, gain_db
+            )
+        yield pad_audio(samples, duration, sample_rate)[: round(duration * sample_rate)]
+
+
+def render_single_encode(
+    event_times,
+    source,
+    output,
+    fps,
+    param,
+    proxy=None,
+    proxy_scale=1.0,
+    index=None,
+):
+    """Renders the final video from the original one in a single encoder pass
+    (no video segments, per event outputs or concatenation)"""
+    timeline = [
+        timeline_item(
+            i,
+            len(event_times),
+            event,
+            previous_event,
+            source,
+            fps,
+            param,
+            proxy,
+            proxy_scale,
+            index,
+        )
+        for i, (event, previous_event) in enumerate(
+            zip(event_times, [None] + event_times[:-1])
         )
+    ]
+    utils.ffmpeg.render_timeline(
+        source,
+        timeline,
+        timeline_audio(
+            event_times,
+            [item["duration"] for item in timeline],
+            source,
+            param,
+            loudness_gains(event_times, source, param),
+        ),
+        param["AUDIO_SAMPLE_RATE"],
+        render_profile(param)["audio_channels"],
+        output,
+        fps,
+        param["CROSSFADEIN_DURATION"],
+        threads=param["ENCODER_THREADS"],
+        profile=render_profile(param),
+    )
+
 
-        video_crossfade = video.subclip(0, param["CROSSFADEIN_DURATION"])
-        video_crossfade = video_crossfade.crossfadein(param["CROSSFADEIN_DURATION"])
-        video_crossfade = mpye.CompositeVideoClip([image_clip, video_crossfade])
-        video_crossfade.write_videofile(
-            os.path.join(temp_folder, f"output{i}_crossfade.mp4")
+def detect_events(abs_paths, temp_folder, param, with_proxy=True):
+    """Events of a recording (log file or silence detection) snapped to its frame grid
+
+    Args:
+        abs_paths (dict): paths of the recording (see utils.utils.process_arguments)
+        temp_folder (string): folder of the temporary files
+        param (dict): parameters of the video editor
+        with_proxy (bool, optional): create the proxy (see PROXY) if it is read,
+                                     False when only the events are needed (the
+                                     plan does not decode frames). Defaults to True.
+
+    Returns:
+        tuple: (list of Events, media index of the recording, proxy path or None)
+    """
+    # Metadata of the recording (probed once, cached next to it)
+    with utils.instrument.stage("probe"):
+        index = utils.probe.media_index(abs_paths["raw"])
+
+    # Low resolution proxy, decoded by the analysis steps instead of the original
+    # (only if silence or colour palette detection will read it)
+    proxy = None
+    if (
+        with_proxy
+        and param["PROXY"]
+        and (not param["LOG_FILE"] or param["REMOVE_COLOUR_PALETTE"])
+    ):
+        proxy = utils.proxy.proxy_path(temp_folder)
+        with utils.instrument.stage("proxy"):
+            make_proxy(abs_paths["raw"], proxy, param)
+
+    with utils.instrument.stage("events"):
+        if param["LOG_FILE"]:
+            event_times = utils.utils.log2times(
+                abs_paths["timestamp"], index["duration"]
+            )
+        elif param["SILENCE_DETECTOR"] == "envelope":
+            envelope = utils.audio.audio_envelope(
+                abs_paths["raw"],
+                param["SILENCE_SAMPLE_RATE"],
+                param["SILENCE_ENVELOPE_MS"],
+                proxy,
+            )
+            event_times = utils.audio.detect_silence_envelope(
+                envelope, param["MIN_SILENCE_MS"], param["SILENCE_THRESHOLD_dB"]
+            )
+        elif param["SILENCE_DETECTOR"] == "stream":
+            event_times = utils.audio.detect_silence_stream(
+                proxy or abs_paths["raw"],
+                param["MIN_SILENCE_MS"],
+                param["SILENCE_THRESHOLD_dB"],
+                param["SILENCE_SAMPLE_RATE"],
+            )
+        else:
+            from pydub import AudioSegment
+
+            video_audio = AudioSegment.from_file(proxy or abs_paths["raw"])
+            if param["SILENCE_DETECTOR"] == "numpy":
+                event_times = utils.audio.detect_silence_numpy(
+                    video_audio,
+                    param["MIN_SILENCE_MS"],
+                    param["SILENCE_THRESHOLD_dB"],
+                )
+            elif param["SILENCE_DETECTOR"] == "pydub":
+                event_times = utils.audio.detect_silence(
+                    video_audio,
+                    param["MIN_SILENCE_MS"],
+                    param["SILENCE_THRESHOLD_dB"],
+                )
+            else:
+                raise Exception(
+                    f"Unknown silence detector: {param['SILENCE_DETECTOR']}"
+                )
+
+    # Immutable events snapped to the frame grid of the video
+    event_times = utils.timeline.snap_events(event_times, index["fps"])
+
+    return event_times, index, proxy
+
+
+def make_proxy(source, proxy, param):
+    """Creates the proxy of a recording, reused from the render cache between runs"""
+    cache = None
+    if param["CACHE"]:
+        cache = utils.cache.RenderCache(
+            param["CACHE_FOLDER"], param["CACHE_MAX_GB"] * 1e9
+        )
+        proxy_key = utils.cache.make_key(
+            "proxy",
+            utils.cache.source_id(source),
+            {key: param[key] for key in utils.cache.PROXY_PARAMETERS},
         )
+        if cache.fetch(proxy_key, proxy):
+            return
 
-        video = video.subclip(t_start=param["CROSSFADEIN_DURATION"])
+    utils.proxy.create_proxy(
+        source,
+        proxy,
+        param["PROXY_HEIGHT"],
+        param["PROXY_FPS"],
+        param["SILENCE_SAMPLE_RATE"],
+    )
+    if cache is not None:
+        cache.store(proxy_key, proxy)
 
-    video.write_videofile(os.path.join(temp_folder, f"output{i}.mp4"))
-    print(f"{i} - COMPLETELY DONE")
 
+def loudness_gains(event_times, source, param):
+    """Gain of each event (dB) from the loudness pass over the whole recording, None
+    if the sound is not normalised"""
+    if not param["NORMALISE_SOUND"]:
+        return [None] * len(event_times)
+    with utils.instrument.stage("loudness"):
+        loudness = utils.audio.momentary_loudness(source)
+    intervals = [
+        event["both"] if event["mode"] == "raw" else event["talk"]
+        for event in event_times
+    ]
+    return utils.audio.event_gains(
+        loudness,
+        intervals,
+        param["LOUDNESS_TARGET_LUFS"],
+        param["LOUDNESS_EVENT_RANGE_dB"],
+    )
 
-if __name__ == "__main__":
 
-    start = time.time()
+def plan_render(event_times, source, index, param, n_workers):
+    """Render plan of a recording, computed from its events and media index
+    (keyframes) without decoding any frame: the segment of each event, the speedup
+    that matches its audio (capped at MAX_SPEEDX when rendered), output duration and
+    estimated cost. The colour palette is not searched, with
+    REMOVE_COLOUR_PALETTE the speedups of the edit events are upper bounds
 
-    # Argument parser
-    args = utils.utils.parse_arguments(param)
-    abs_paths = utils.utils.process_arguments(args)
+    Args:
+        event_times (list of Events): events of the recording
+        source (string): path of the recording
+        index (dict): media index of the recording (see utils.probe)
+        param (dict): parameters of the video editor
+        n_workers (int): number of workers
+
+    Returns:
+        dict: render plan (JSON serializable, see utils.plan)
+    """
+    profile = render_profile(param)
+    sample_rate = param["AUDIO_SAMPLE_RATE"]
+    n_events = len(event_times)
+    fps = index["fps"]
 
-    # Import video file
-    video = mpye.VideoFileClip(abs_paths["raw"])
+    # Segments start at the previous keyframe, the offset is stored in the event
+    segments = [event.segment_times() for event in event_times]
+    keyframes = index["keyframes"]
+    starts = utils.video.keyframe_starts(keyframes, segments)
 
-    # Create folder
-    temp_folder = os.path.join(tempfile.gettempdir(), "video_editing")
-    if not os.path.exists(temp_folder):
-        os.mkdir(temp_folder)
+    smart_cut = smart_cut_allowed(index, profile, param)
+    gains = loudness_gains(event_times, source, param)
 
-    # Clean temp folder
-    for filename in os.listdir(temp_folder):
-        file_path = os.path.join(temp_folder, filename)
-        os.remove(file_path)
+    events = []
+    for i, (event, start, (t_beg, t_end), gain_db) in enumerate(
+        zip(event_times, starts, segments, gains)
+    ):
+        event = event.with_offset(t_beg - start)
+        audio_seconds = edited_audio_duration(i, n_events, event, param)
+        if event["mode"] == "raw":
+            video_seconds = event.n_frames("both") / fps
+            extend_seconds = 0
+            speedup = 1.0
+            output_seconds = audio_seconds
+        else:
+            video_seconds = event.n_frames("draw") / fps
+            extend_seconds = utils.video.extension_duration(
+                video_seconds, param["EXTEND_LAST_FRAME"]
+            )
+            speedup = (video_seconds + extend_seconds) / audio_seconds
+            _, output_seconds = capped_speedup(
+                video_seconds + extend_seconds, audio_seconds, param
+            )
 
-    if param["LOG_FILE"]:
-        event_times = utils.utils.log2times(abs_paths["timestamp"], video.duration)
+        # Outputs last a whole number of frames (see utils.timeline.pad_to_frames)
+        output_seconds = (
+            utils.timeline.output_frames(
+                round(output_seconds * sample_rate), sample_rate, fps
+            )
+            / fps
+        )
+
+        # Smart cut raw events only encode their edges (see utils.ffmpeg.smart_cut_event)
+        encode_seconds = output_seconds
+        cut_points = None
+        if smart_cut and event["mode"] == "raw":
+            cut_points = utils.ffmpeg.smart_cut_points(
+                keyframes,
+                [t_beg, t_end],
+                param["CROSSFADEIN_DURATION"] if i > 0 else 0,
+            )
+        if cut_points is not None:
+            encode_seconds = cut_points[0] - t_beg + t_end - cut_points[1]
+
+        events.append(
+            {
+                "index": i,
+                "mode": event.mode,
+                "frames": list(event.frames),
+                "offset_frames": event.offset_frames,
+                "segment": [t_beg, t_end],
+                "keyframe": start,
+                "video_seconds": video_seconds,
+                "extend_seconds": extend_seconds,
+                "speedup": speedup,
+                "gain_db": gain_db,
+                "output_seconds": output_seconds,
+                "smart_cut": cut_points is not None,
+                "encode_seconds": encode_seconds,
+                "decode_seconds": t_end - start,
+                "cost": encode_seconds / profile["encode_speed"],
+            }
+        )
+
+    costs = [item["cost"] for item in events]
+    return {
+        "version": utils.plan.PLAN_VERSION,
+        "source": utils.cache.source_id(source),
+        "fps": fps,
+        "profile": param["RENDER_PROFILE"],
+        "n_workers": n_workers,
+        "parameters": {
+            key: param[key]
+            for key in utils.cache.AUDIO_PARAMETERS + utils.cache.VIDEO_PARAMETERS
+        },
+        "events": events,
+        "totals": {
+            "output_seconds": sum(item["output_seconds"] for item in events),
+            "encode_seconds": sum(item["encode_seconds"] for item in events),
+            "decode_seconds": sum(item["decode_seconds"] for item in events),
+            "capped_events": sum(
+                item["speedup"] > param["MAX_SPEEDX"] for item in events
+            ),
+            "wall_seconds": utils.plan.estimate_wall_time(costs, n_workers),
+        },
+    }
+
+
+def split_events(source, plan, temp_folder, param, cache=None):
+    """Extracts the video segment of each event of a render plan (stream copy from
+    the keyframe found by plan_render), segments already in the cache are not
+    extracted again
+
+    Args:
+        source (string): path of the recording
+        plan (dict): render plan (see plan_render)
+        temp_folder (string): folder of the video segments
+        param (dict): parameters of the video editor
+        cache (RenderCache, optional): render cache. Defaults to None.
+
+    Returns:
+        list: cache key of each segment
+    """
+    # Split video into parts
+    segments = [item["segment"] for item in plan["events"]]
+    starts = [item["keyframe"] for item in plan["events"]]
+    destinations = [
+        os.path.join(temp_folder, f"video_segment_{i}.mp4")
+        for i in range(len(segments))
+    ]
+
+    if cache is not None:
+        raw_id = utils.cache.source_id(source)
+        segment_keys = [
+            utils.cache.make_key(raw_id, t_beg, t_end) for t_beg, t_end in segments
+        ]
+        missing = [
+            i
+            for i, (key, destination) in enumerate(zip(segment_keys, destinations))
+            if not cache.fetch(key, destination)
+        ]
     else:
-        # Save audio
-        temp_audio_file = os.path.join(temp_folder, "temp_audio.wav")
-        audio = video.audio
-        if os.path.exists(temp_audio_file):
-            os.remove(temp_audio_file)
-        audio.write_audiofile(temp_audio_file)
-
-        video_audio = AudioSegment.from_file(temp_audio_file, temp_audio_file[-3:])
-        event_times = utils.audio.detect_silence(
-            video_audio, param["MIN_SILENCE_MS"], param["SILENCE_THRESHOLD_dB"]
+        segment_keys = [None] * len(segments)
+        missing = list(range(len(segments)))
+
+    with utils.instrument.stage("split"):
+        utils.video.extract_videos(
+            source,
+            [starts[i] for i in missing],
+            [segments[i][1] for i in missing],
+            [destinations[i] for i in missing],
+            plan["fps"],
+            param["SPLIT_WORKERS"],
+        )
+        if cache is not None:
+            for i in missing:
+                cache.store(segment_keys[i], destinations[i])
+
+    return segment_keys
+
+
+def track_intermediates(workspace, plan, index, source):
+    """Reserves the workspace for the video segments of a render plan and registers
+    the consumers of each intermediate: segment i is read by events i and i + 1
+    (crossfade), the proxy by every event and the outputs by the concatenation"""
+    # Segments are stream copies, their size is proportional to their duration
+    bytes_per_second = os.path.getsize(source) / max(index["duration"], 1e-6)
+    workspace.reserve(
+        plan["totals"]["decode_seconds"] * bytes_per_second, "the video segments"
+    )
+
+    n_events = len(plan["events"])
+    for i in range(n_events):
+        workspace.produced(
+            workspace.path(f"video_segment_{i}.mp4"),
+            [("event", k) for k in (i, i + 1) if k < n_events],
+        )
+        workspace.produced(workspace.path(f"output{i}.mp4"), ["concat"])
+    proxy = utils.proxy.proxy_path(workspace.folder)
+    if os.path.exists(proxy):
+        workspace.produced(proxy, [("event", k) for k in range(n_events)])
+
+
+def event_arguments(plan, index, temp_folder, param, segment_keys):
+    """Arguments of process_event for each event of a render plan, the workers get
+    the media index of their segment instead of probing it"""
+    event_times = utils.plan.plan_events(plan)
+    n_events = len(event_times)
+    arguments = []
+    for i, (event, item) in enumerate(zip(event_times, plan["events"])):
+        previous_event = event_times[i - 1] if i > 0 else None
+        media = utils.probe.segment_index(index, item["keyframe"], item["segment"][1])
+        arguments.append(
+            (
+                i,
+                n_events,
+                event,
+                temp_folder,
+                param,
+                previous_event,
+                segment_keys[i],
+                item["gain_db"],
+                media,
+            )
         )
+    return arguments
+
+
+def warm_worker():
+    """Initializer of the worker processes: the render modules are imported once per
+    worker, while the main process is still detecting events and splitting"""
+    global WORKER_STARTUP
+    start = time.perf_counter()
+    import moviepy.editor  # noqa: F401
+    from moviepy.audio.AudioClip import AudioArrayClip  # noqa: F401
+
+    WORKER_STARTUP = time.perf_counter() - start
+
 
+def worker_startup():
+    """Process id and seconds taken by warm_worker in this worker"""
+    return os.getpid(), WORKER_STARTUP
+
+
+def show_timestamps(abs_paths, args, param):
+    event_times = utils.utils.log2times(
+        abs_paths["timestamp"], utils.probe.media_index(abs_paths["raw"])["duration"]
+    )
     utils.utils.print_timestamps(event_times)
 
-    # Split video into parts
-    for i, event in enumerate(event_times):
-        source = abs_paths["raw"]
-        destination = os.path.join(temp_folder, f"video_segment_{i}.mp4")
-        if event["mode"] == "raw":
-            utils.video.extract_video(
-                source, destination, event["both"][0], event["both"][1]
+
+def show_silence(abs_paths, args, param):
+    envelope = utils.audio.audio_envelope(
+        abs_paths["raw"], param["SILENCE_SAMPLE_RATE"], param["SILENCE_ENVELOPE_MS"]
+    )
+    start = time.perf_counter()
+    event_times = utils.audio.detect_silence_envelope(
+        envelope, args.min_silence_ms, None if args.adaptive else args.threshold
+    )
+    print(f"INFO: Silence search: {(time.perf_counter() - start) * 1000:.1f} ms")
+    utils.utils.print_timestamps(event_times)
+
+
+def show_plan(abs_paths, args, param):
+    param = dict(param, RENDER_PROFILE=args.profile)
+    with utils.workspace.Workspace(
+        param["WORKSPACE_FOLDER"], tmpfs=param["WORKSPACE_TMPFS"]
+    ) as workspace:
+        event_times, index, _ = detect_events(
+            abs_paths, workspace.folder, param, with_proxy=False
+        )
+    plan = plan_render(
+        event_times, abs_paths["raw"], index, param, utils.scheduler.max_workers(param)
+    )
+    utils.plan.print_plan(plan)
+    if args.output:
+        utils.plan.save_plan(plan, args.output)
+        print(f"INFO: Render plan saved in {args.output}")
+
+
+# Light subcommands (no rendering, moviepy is not imported)
+SUBCOMMANDS = {
+    "timestamps": show_timestamps,
+    "silence": show_silence,
+    "plan": show_plan,
+}
+
+
+if __name__ == "__main__":
+
+    start = time.time()
+    # Workers write the partial traces of this run only (see run_trace_file)
+    param["TRACE_FILE"] = utils.instrument.run_trace_file(param["TRACE_FILE"])
+    utils.instrument.configure(param["TRACE_FILE"], param["PROFILE_STAGES"])
+
+    # Argument parser
+    with utils.instrument.stage("arguments"):
+        args = utils.utils.parse_arguments(param, SUBCOMMANDS)
+        abs_paths = utils.utils.process_arguments(args)
+    # Wall time of the imports and argument parsing
+    print(f"INFO: Startup ({args.command}): {utils.startup.elapsed():.2f} s")
+
+    if args.command in SUBCOMMANDS:
+        SUBCOMMANDS[args.command](abs_paths, args, param)
+        print(f"DONE in {time.time() - start:.1f} seconds")
+        sys.exit(0)
+    param["RENDER_PROFILE"] = args.profile
+
+    # Workspace and workers are released even if the run fails (workers first)
+    with contextlib.ExitStack() as stack:
+        # Workspace of this run (intermediates deleted once consumed)
+        workspace = stack.enter_context(
+            utils.workspace.Workspace(
+                param["WORKSPACE_FOLDER"],
+                budget_bytes=param["WORKSPACE_BUDGET_GB"]
+                and param["WORKSPACE_BUDGET_GB"] * 1e9,
+                tmpfs=param["WORKSPACE_TMPFS"],
             )
+        )
 
-        elif event["mode"] == "edit":
-            utils.video.extract_video(
-                source, destination, event["draw"][0], event["talk"][1]
+        # Workers start importing the render modules right away
+        executor = None
+        if not args.watch and not param["SINGLE_ENCODE"]:
+            n_workers = utils.scheduler.max_workers(param)
+            executor = stack.enter_context(
+                concurrent.futures.ProcessPoolExecutor(
+                    n_workers, initializer=warm_worker
+                )
             )
+            warm_ups = [executor.submit(worker_startup) for _ in range(n_workers)]
+
+        temp_folder = workspace.folder
+        utils.instrument.configure(
+            param["TRACE_FILE"], param["PROFILE_STAGES"], temp_folder
+        )
+
+        if args.watch:
+            # Events are edited while OBS is recording, only the last one is left
+            with utils.instrument.stage("watch"):
+                event_times = utils.watch.watch_recording(
+                    abs_paths["raw"],
+                    abs_paths["timestamp"],
+                    temp_folder,
+                    param,
+                    process_event,
+                )
         else:
-            raise Exception(f"Unkown event mode: {event['mode']}")
+            event_times, index, proxy = detect_events(abs_paths, temp_folder, param)
 
-    print("------------------------------------------------------------------------")
-    print("----------------------- START PARALLEL CALLS ---------------------------")
-    print("------------------------------------------------------------------------")
+        utils.utils.print_timestamps(event_times)
 
-    index = range(len(event_times))
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        executor.map(
-            process_event,
-            index,
-            itertools.repeat(len(event_times)),
-            event_times,
-            itertools.repeat(temp_folder),
-            itertools.repeat(param),
-        )
+        if args.watch:
+            # Join video segments
+            video_list = []
+            for i in range(len(event_times)):
+                video_list.append(os.path.join(temp_folder, f"output{i}.mp4"))
+            with utils.instrument.stage("concat"):
+                utils.video.concatenate_videos(video_list, abs_paths["edited"])
+        elif param["SINGLE_ENCODE"]:
+            with utils.instrument.stage("single_encode"):
+                render_single_encode(
+                    event_times,
+                    abs_paths["raw"],
+                    abs_paths["edited"],
+                    index["fps"],
+                    param,
+                    proxy,
+                    utils.proxy.scale(index["height"], param),
+                    index,
+                )
+        else:
+            # Render cache (persistent between runs)
+            cache = None
+            if param["CACHE"]:
+                cache = utils.cache.RenderCache(
+                    param["CACHE_FOLDER"], param["CACHE_MAX_GB"] * 1e9
+                )
+
+            # Render plan (inspected / diffed next to the recording), executed below
+            with utils.instrument.stage("plan"):
+                plan = plan_render(
+                    event_times, abs_paths["raw"], index, param, n_workers
+                )
+            utils.plan.save_plan(plan, utils.plan.plan_path(abs_paths["raw"]))
+            utils.plan.print_plan(plan)
+            event_times = utils.plan.plan_events(plan)
+            track_intermediates(workspace, plan, index, abs_paths["raw"])
 
-    # Join video segments
-    video_list = []
-    for i in range(len(event_times)):
-        if i != 0:
-            video_list.append(os.path.join(temp_folder, f"output{i}_crossfade.mp4"))
-        video_list.append(os.path.join(temp_folder, f"output{i}.mp4"))
-    utils.video.concatenate_videos(video_list, abs_paths["edited"])
-
-    if abs_paths["move"]:
-        if args.output_file[0] != "S":
-            print(f"Ouput video name: {args.output_file}")
-            answer = input(
-                "WARNING: Output video might be wrong do you want to continue?[y/N]\n"
+            segment_keys = split_events(
+                abs_paths["raw"], plan, temp_folder, param, cache
             )
-            if answer.lower() == "y":
-                os.rename(abs_paths["raw"], abs_paths["raw_move"])
-                os.rename(abs_paths["edited"], abs_paths["edit_move"])
-                os.rename(abs_paths["timestamp"], abs_paths["timestamp_move"])
-
-        os.rename(abs_paths["raw"], abs_paths["raw_move"])
-        os.rename(abs_paths["edited"], abs_paths["edit_move"])
-        os.rename(abs_paths["timestamp"], abs_paths["timestamp_move"])
+
+            print(
+                "------------------------------------------------------------------------"
+            )
+            print(
+                "----------------------- START PARALLEL CALLS ---------------------------"
+            )
+            print(
+                "------------------------------------------------------------------------"
+            )
+
+            arguments = event_arguments(plan, index, temp_folder, param, segment_keys)
+            with utils.instrument.stage("process_events"):
+                results = utils.scheduler.run_events(
+                    process_event,
+                    arguments,
+                    [item["cost"] for item in plan["events"]],
+                    n_workers,
+                    executor,
+                    on_done=lambda k: workspace.consumed(("event", k)),
+                )
+            executor.shutdown()
+            # A worker may run several warm ups, only the ones that ran are measured
+            startups = dict(future.result() for future in warm_ups)
+            print(
+                f"INFO: Worker startup: {max(startups.values()):.2f} s "
+                f"({len(startups)} of {n_workers} workers, overlapped with split)"
+            )
+
+            if cache is not None:
+                utils.cache.print_report([cache.stats()] + results, cache.evict())
+
+            # Join video segments
+            video_list = []
+            for i in range(len(event_times)):
+                video_list.append(os.path.join(temp_folder, f"output{i}.mp4"))
+            with utils.instrument.stage("concat"):
+                utils.video.concatenate_videos(video_list, abs_paths["edited"])
+            workspace.consumed("concat")
+
+        if abs_paths["move"]:
+            if args.output_file[0] != "S":
+                print(f"Ouput video name: {args.output_file}")
+                answer = input(
+                    "WARNING: Output video might be wrong do you want to continue?[y/N]\n"
+                )
+                if answer.lower() == "y":
+                    os.rename(abs_paths["raw"], abs_paths["raw_move"])
+                    os.rename(abs_paths["edited"], abs_paths["edit_move"])
+                    os.rename(abs_paths["timestamp"], abs_paths["timestamp_move"])
+
+            os.rename(abs_paths["raw"], abs_paths["raw_move"])
+            os.rename(abs_paths["edited"], abs_paths["edit_move"])
+            os.rename(abs_paths["timestamp"], abs_paths["timestamp_move"])
+
+        if param["TRACE_FILE"]:
+            utils.instrument.merge_trace(param["TRACE_FILE"])
 
     enlapsed_time = time.time() - start
     print(f"DONE in {time.time() - start:.1f} seconds ({enlapsed_time / 60:.1f} min)")